@@ -0,0 +1,166 @@
+import sys, threading, time # In-process IVF-Flat ANN index over the local embedding snapshot (hot-swappable)
+import numpy as np
+sys.path.insert(0, str(__file__).rsplit("/", 2)[0])
+from settings import ANN_NLIST, ANN_NPROBE, ANN_REFRESH_SECONDS
+from vector_db.local_store import LocalEmbeddingStore
+
+RESULT_COLUMNS = ["content_hash", "image_url", "category", "category_type"]
+FILTER_COLUMNS = ["category", "category_type", "source", "cluster_id"]  # Equality / IN predicates → posting lists
+TRAIN_POINTS_PER_LIST = 64
+TRAIN_ITERS = 10
+
+def _normalize(x: np.ndarray) -> np.ndarray:
+    return x / np.maximum(np.linalg.norm(x, axis=-1, keepdims=True), 1e-12)
+
+def _train_centroids(x: np.ndarray, nlist: int, seed: int = 42) -> np.ndarray:  # Spherical k-means on a sample
+    rng = np.random.default_rng(seed)
+    sample = x[np.sort(rng.choice(len(x), min(len(x), nlist * TRAIN_POINTS_PER_LIST), replace=False))]
+    cents = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+    for _ in range(TRAIN_ITERS):
+        assign = (sample @ cents.T).argmax(axis=1)
+        sums = np.zeros_like(cents)
+        np.add.at(sums, assign, sample)
+        empty = np.bincount(assign, minlength=nlist) == 0
+        sums[empty] = sample[rng.choice(len(sample), int(empty.sum()))]  # Re-seed dead cells
+        cents = _normalize(sums)
+    return cents
+
+class IVFIndex:
+    """Vectors are stored grouped by coarse cell so a probe is one contiguous slice matmul."""
+    def __init__(self, embeddings: np.ndarray, columns: dict[str, list], nlist: int = ANN_NLIST, version: int = 0):
+        t0 = time.time()
+        self.version = version  # LocalEmbeddingStore.version() the vectors were read at
+        n = len(embeddings)
+        self.nlist = max(1, min(nlist, n // TRAIN_POINTS_PER_LIST or 1))
+        x = _normalize(np.asarray(embeddings, dtype=np.float32))
+        self.centroids = _train_centroids(x, self.nlist)
+        assign = np.concatenate([(x[i:i + 65536] @ self.centroids.T).argmax(axis=1) for i in range(0, n, 65536)]) if n else np.empty(0, dtype=np.int64)
+        order = np.argsort(assign, kind="stable")
+        self.vectors = x[order]
+        self.ids = order
+        self.offsets = np.concatenate([[0], np.cumsum(np.bincount(assign, minlength=self.nlist))])
+        self.size = n
+        self._bind(columns)
+        self.build_seconds = time.time() - t0
+
+    def _bind(self, columns: dict[str, list]):  # Per-attribute posting lists in index (cell-grouped) order
+        self.columns = {c: columns[c] for c in RESULT_COLUMNS}
+        self.postings: dict[str, dict] = {}
+        for c in FILTER_COLUMNS:
+            vals = np.array([str(v) if v is not None else "" for v in columns.get(c, [None] * self.size)], dtype=object)[self.ids]
+            uniq, inv = np.unique(vals, return_inverse=True)
+            order = np.argsort(inv, kind="stable")
+            bounds = np.concatenate([[0], np.cumsum(np.bincount(inv, minlength=len(uniq)))])
+            self.postings[c] = {u: order[bounds[j]:bounds[j + 1]] for j, u in enumerate(uniq) if u}
+        aes = columns.get("qalign_aesthetic", [None] * self.size)
+        self.aesthetic = np.array([np.nan if v is None else v for v in aes], dtype=np.float32)[self.ids]
+
+    def rebind(self, columns: dict[str, list]) -> "IVFIndex":  # New index sharing vectors/centroids, fresh filter attributes
+        clone = object.__new__(IVFIndex)
+        clone.__dict__.update({k: v for k, v in self.__dict__.items() if k not in ("columns", "postings", "aesthetic", "_by_url")})
+        clone._bind(columns)
+        return clone
+
+    def filter_mask(self, filters: dict | None) -> np.ndarray | None:  # Intersection of per-attribute bitmaps; None = unfiltered
+        if not filters: return None
+        mask = None
+        for c in FILTER_COLUMNS:
+            want = filters.get(c)
+            if want is None: continue
+            m = np.zeros(self.size, dtype=bool)
+            for v in (want if isinstance(want, (list, tuple, set)) else [want]):
+                post = self.postings[c].get(str(v))
+                if post is not None: m[post] = True
+            mask = m if mask is None else mask & m
+        if filters.get("min_aesthetic") is not None:
+            with np.errstate(invalid="ignore"): m = self.aesthetic >= float(filters["min_aesthetic"])  # NaN (unscored) never passes
+            mask = m if mask is None else mask & m
+        return mask
+
+    def search(self, query: list[float] | np.ndarray, k: int = 20, nprobe: int = ANN_NPROBE, mask: np.ndarray | None = None) -> tuple[np.ndarray, np.ndarray]:  # (similarities, row ids) sorted desc
+        q = _normalize(np.asarray(query, dtype=np.float32))
+        nprobe = min(nprobe, self.nlist)
+        if mask is None:  # Contiguous per-cell slices, no gather copy
+            cells = np.argpartition(-(self.centroids @ q), nprobe - 1)[:nprobe]
+            sims = np.concatenate([self.vectors[self.offsets[c]:self.offsets[c + 1]] @ q for c in cells])
+            pos = np.concatenate([np.arange(self.offsets[c], self.offsets[c + 1]) for c in cells])
+        else:
+            allowed = np.flatnonzero(mask)
+            if len(allowed) <= self.size * nprobe / self.nlist:  # Selective filter: exact scan of the survivors beats probing
+                pos = allowed
+            else:  # Probe cells nearest-first until nprobe cells AND k survivors are covered; predicates applied inside the scan
+                cells = np.argsort(-(self.centroids @ q))
+                survivors = np.concatenate([[0], np.cumsum(mask)])
+                per_cell = (survivors[self.offsets[1:]] - survivors[self.offsets[:-1]])[cells]
+                enough = np.searchsorted(np.cumsum(per_cell), k)
+                cells = cells[:max(nprobe, int(enough) + 1)]
+                pos = np.concatenate([np.arange(self.offsets[c], self.offsets[c + 1]) for c in cells])
+                pos = pos[mask[pos]]
+            if not len(pos): return np.empty(0, dtype=np.float32), np.empty(0, dtype=np.int64)
+            sims = self.vectors[pos] @ q
+        if len(sims) > k:
+            top = np.argpartition(-sims, k - 1)[:k]
+            sims, pos = sims[top], pos[top]
+        order = np.argsort(-sims)
+        return sims[order], self.ids[pos[order]]
+
+    def hash_for_url(self, image_url: str) -> str | None:  # image_url → content_hash for catalog rows (dict built on first use)
+        if getattr(self, "_by_url", None) is None: self._by_url = dict(zip(self.columns["image_url"], self.columns["content_hash"]))
+        return self._by_url.get(image_url)
+
+    def rows(self, sims: np.ndarray, ids: np.ndarray) -> list[dict]:  # Same shape as match_embeddings RPC rows
+        return [{**{c: self.columns[c][i] for c in RESULT_COLUMNS}, "similarity": float(s)} for s, i in zip(sims, ids)]
+
+_index: IVFIndex | None = None
+_build_lock = threading.Lock()
+_refresher: threading.Thread | None = None
+
+def get_index() -> IVFIndex | None:  # Current index (None until the first build finishes)
+    return _index
+
+def build_index(sync: bool = True) -> IVFIndex | None:  # Build from the local snapshot off to the side, then swap the reference
+    global _index
+    with _build_lock:
+        store = LocalEmbeddingStore()
+        if sync:
+            try: store.sync(); store.refresh_attributes()
+            except Exception as e: print(f"⚠️ Snapshot sync failed, indexing local copy: {e}")
+        if not store.exists() or not len(store): return _index
+        meta_stamp = store.meta_path.stat().st_mtime_ns  # Sidecar-only writes (attributes, synced metadata) move this but not the version
+        if _index is not None and _index.version == store.version():  # Same vectors (none added or replaced): at most re-derive filter bitmaps
+            if _index.meta_stamp != meta_stamp:
+                _index = _index.rebind(store.meta()["columns"])
+                _index.meta_stamp = meta_stamp
+            return _index
+        index = IVFIndex(store.embeddings(), store.meta()["columns"], version=store.version())
+        index.meta_stamp = meta_stamp
+        _index = index  # Atomic reference swap: in-flight searches keep the old index
+        print(f"✅ ANN index ready: {index.size} vectors, nlist={index.nlist}, built in {index.build_seconds:.1f}s")
+        return index
+
+def search(embedding: list[float], k: int = 20, filters: dict | None = None, nprobe: int = ANN_NPROBE) -> list[dict] | None:  # None = index not ready, caller falls back to pgvector
+    index = _index
+    if index is None: return None
+    return index.rows(*index.search(embedding, k, nprobe, mask=index.filter_mask(filters)))
+
+def catalog_hash(image_url: str) -> str | None:  # content_hash if the URL is a catalog image (None: unknown URL or index not ready)
+    index = _index
+    return None if index is None else index.hash_for_url(image_url)
+
+def index_info() -> dict:
+    index = _index
+    if index is None: return {"ready": False}
+    return {"ready": True, "size": index.size, "nlist": index.nlist, "nprobe": ANN_NPROBE, "build_seconds": round(index.build_seconds, 2)}
+
+def _refresh_loop(interval: int):
+    while True:
+        try: build_index(sync=True)
+        except Exception as e: print(f"⚠️ ANN index build failed: {e}")
+        if interval <= 0: return
+        time.sleep(interval)
+
+def start_background_refresh(interval: int = ANN_REFRESH_SECONDS):  # Build on a daemon thread so startup doesn't block
+    global _refresher
+    if _refresher is None or not _refresher.is_alive():
+        _refresher = threading.Thread(target=_refresh_loop, args=(interval,), daemon=True, name="ann-index-refresh")
+        _refresher.start()
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""Concurrency benchmark: /search/text throughput + /health latency under load (run against a live server)"""
+import asyncio, json, sys, time, uuid
+import numpy as np
+import httpx
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from settings import OUTPUT_DIR
+
+QUERIES = ["minimal luxury product shot", "warm cozy cafe interior", "bold colorful sneaker ad", "dark moody perfume bottle", "pastel skincare flat lay", "surreal floating watch"]
+PROBE_INTERVAL = 0.05
+
+async def _probe(client: httpx.AsyncClient, path: str, stop: asyncio.Event, out: list[float]):  # Poll a cheap endpoint while searches run
+    while not stop.is_set():
+        t0 = time.perf_counter()
+        await client.get(path)
+        out.append(time.perf_counter() - t0)
+        await asyncio.sleep(PROBE_INTERVAL)
+
+async def _search(client: httpx.AsyncClient, sem: asyncio.Semaphore, i: int, unique: bool, out: list[float]):
+    query = QUERIES[i % len(QUERIES)] + (f" {uuid.uuid4().hex[:6]}" if unique else "")  # unique=True defeats the LRU
+    async with sem:
+        t0 = time.perf_counter()
+        resp = await client.post("/search/text", json={"query": query, "k": 20})
+        if resp.status_code == 200: out.append(time.perf_counter() - t0)
+
+async def run_level(base_url: str, concurrency: int, requests: int, unique: bool) -> dict:
+    async with httpx.AsyncClient(base_url=base_url, timeout=120, limits=httpx.Limits(max_connections=concurrency + 4)) as client:
+        stop, search_lat, health_lat, stats_lat = asyncio.Event(), [], [], []
+        probes = [asyncio.create_task(_probe(client, "/health", stop, health_lat)), asyncio.create_task(_probe(client, "/stats", stop, stats_lat))]
+        sem = asyncio.Semaphore(concurrency)
+        t0 = time.perf_counter()
+        await asyncio.gather(*[_search(client, sem, i, unique, search_lat) for i in range(requests)])
+        wall = time.perf_counter() - t0
+        stop.set(); await asyncio.gather(*probes)
+        pct = lambda xs, p: round(float(np.percentile(xs, p)) * 1000, 1) if xs else None
+        return {"concurrency": concurrency, "ok": len(search_lat), "rps": round(len(search_lat) / wall, 2), "search_p50_ms": pct(search_lat, 50), "search_p99_ms": pct(search_lat, 99), "health_p99_ms": pct(health_lat, 99), "stats_p99_ms": pct(stats_lat, 99)}
+
+async def run_benchmark(base_url: str, levels: list[int], requests: int, unique: bool) -> list[dict]:
+    async with httpx.AsyncClient(base_url=base_url, timeout=300) as client: await client.post("/search/text", json={"query": "warmup", "k": 1})  # Model load outside timing
+    results = []
+    print(f"{'conc':>5} {'ok':>5} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'/health p99':>12} {'/stats p99':>11}")
+    for c in levels:
+        r = await run_level(base_url, c, requests, unique)
+        results.append(r)
+        print(f"{r['concurrency']:>5} {r['ok']:>5} {r['rps']:>8} {r['search_p50_ms']:>8} {r['search_p99_ms']:>8} {r['health_p99_ms']:>12} {r['stats_p99_ms']:>11}")
+    return results
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description="Benchmark API concurrency scaling")
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--levels", default="1,4,16,64", help="Comma-separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=128, help="Search requests per level")
+    parser.add_argument("--cached", action="store_true", help="Repeat queries (measures the LRU path instead of inference)")
+    args = parser.parse_args()
+    results = asyncio.run(run_benchmark(args.url, [int(x) for x in args.levels.split(",")], args.requests, unique=not args.cached))
+    out = OUTPUT_DIR / "bench_concurrency.json"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    with open(out, "w") as f: json.dump(results, f, indent=2)
+    print(f"💾 Saved: {out}")
+
+if __name__ == "__main__":
+    main()
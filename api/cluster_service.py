@@ -1,46 +1,120 @@
-import json # Cluster data service
+import asyncio, json, hashlib, os, sys, threading, time # Cluster data service
 from pathlib import Path
-from functools import lru_cache
 from collections import Counter
+sys.path.insert(0, str(__file__).rsplit("/", 2)[0])
+from settings import CLUSTERS_WATCH_SECONDS, CLUSTERS_ARTIFACT, CLUSTERS_JSON
+from clustering.cluster_artifact import ClusterArtifact
 
-CLUSTERS_PATH = Path(__file__).parent.parent / "output" / "clusters.json"
-_clusters_cache = None
+CLUSTERS_PATH = CLUSTERS_JSON  # Legacy fallback when no binary artifact exists
+ARTIFACT_META = CLUSTERS_ARTIFACT / "meta.json"  # Artifact commit point: its stamp changes once per clustering run
 
-def _load_clusters() -> list[dict]: # Load clusters from JSON (cached)
-    global _clusters_cache
-    if _clusters_cache is None:
-        if not CLUSTERS_PATH.exists(): raise FileNotFoundError(f"clusters.json not found at {CLUSTERS_PATH}")
-        with open(CLUSTERS_PATH) as f: _clusters_cache = json.load(f)
-    return _clusters_cache
+def _serialize(obj) -> tuple[bytes, str]: # Compact JSON body + strong ETag
+    body = json.dumps(obj, separators=(",", ":")).encode()
+    return body, f'"{hashlib.sha1(body).hexdigest()[:20]}"'
+
+class ClusterIndex: # Immutable snapshot built once per load: id lookup, sorted summaries, stats and response bodies
+    def __init__(self, clusters: list[dict], version: int = 0, stamp: tuple = (), centers=None):
+        self.clusters, self.version, self.stamp = clusters, version, stamp
+        self.by_id = {c["cluster_id"]: c for c in clusters}
+        self._centers, self._row = centers, {c["cluster_id"]: i for i, c in enumerate(clusters)}  # Artifact centers stay memmapped until asked for
+        summaries = []
+        for c in clusters:
+            reps = c.get("representatives", [])
+            top_cats = [cat for cat, _ in Counter(r.get("category", "unknown") for r in reps).most_common(3)]
+            previews = [r.get("image_url") for r in reps[:3] if r.get("image_url")]
+            summaries.append({"cluster_id": c["cluster_id"], "size": c["size"], "top_categories": top_cats, "preview_images": previews})
+        self.summaries = sorted(summaries, key=lambda x: x["size"], reverse=True)
+        cat_dist = Counter(r.get("category", "unknown") for c in clusters for r in c.get("representatives", []))
+        self.stats = {"total_images": sum(c["size"] for c in clusters), "total_clusters": len(clusters), "category_distribution": dict(cat_dist.most_common())}
+        self.summaries_body = _serialize([{k: s[k] for k in ("cluster_id", "size", "top_categories")} for s in self.summaries])  # ClusterSummary shape
+        self.stats_body = _serialize(self.stats)
+        self._detail_bodies: dict[tuple[int, bool], tuple[bytes, str]] = {}
+
+    def detail(self, cluster_id: int, include_center: bool = False) -> dict | None:
+        c = self.by_id.get(cluster_id)
+        if c is None: return None
+        d = {"cluster_id": c["cluster_id"], "size": c["size"], "representatives": c.get("representatives", [])}
+        if include_center: d["center_embedding"] = self._centers[self._row[cluster_id]].tolist() if self._centers is not None else c.get("center_embedding")
+        return d
+
+    def detail_body(self, cluster_id: int, include_center: bool = False) -> tuple[bytes, str] | None: # Serialized lazily, then memoized
+        key = (cluster_id, include_center)
+        if key not in self._detail_bodies:
+            d = self.detail(cluster_id, include_center)
+            if d is None: return None
+            self._detail_bodies[key] = _serialize(d)
+        return self._detail_bodies[key]
+
+_index: ClusterIndex | None = None
+_load_lock = threading.Lock()
+_watcher: threading.Thread | None = None
+
+def _source() -> Path: # Prefer the binary artifact; clusters.json only if clustering ran with --json and no artifact exists
+    return ARTIFACT_META if ARTIFACT_META.exists() else CLUSTERS_PATH
+
+def _stamp() -> tuple: # (path, mtime_ns, size) identifies a file version without reading it
+    path = _source()
+    st = os.stat(path)
+    return str(path), st.st_mtime_ns, st.st_size
+
+def _build_if_changed(stamp: tuple | None = None) -> bool: # Parse + index a new file version off to the side, then swap the reference
+    global _index
+    with _load_lock:
+        stamp = stamp or _stamp()
+        if _index is not None and _index.stamp == stamp: return False
+        centers = None
+        if stamp[0] == str(ARTIFACT_META):
+            artifact = ClusterArtifact(CLUSTERS_ARTIFACT)
+            clusters, centers = artifact.to_dicts(), artifact.centers
+        else:
+            with open(CLUSTERS_PATH) as f: clusters = json.load(f)
+        version = (_index.version + 1) if _index is not None else 1
+        _index = ClusterIndex(clusters, version, stamp, centers)  # Atomic swap: readers hold either the old or the new snapshot
+        print(f"🔄 Loaded clusters v{version}: {len(clusters)} clusters")
+        return True
+
+def _load_index() -> ClusterIndex: # Current snapshot; only loads inline if the watcher hasn't produced one yet
+    index = _index
+    if index is not None: return index
+    if not _source().exists(): raise FileNotFoundError(f"No clusters found at {CLUSTERS_ARTIFACT} or {CLUSTERS_PATH}")
+    _build_if_changed()
+    return _index
+
+def get_index() -> ClusterIndex:
+    return _load_index()
+
+async def get_index_async() -> ClusterIndex: # For request handlers: a cold load (before the watcher's first pass) parses the artifact in a thread, not on the event loop
+    index = _index
+    return index if index is not None else await asyncio.to_thread(_load_index)
 
 def get_all_clusters() -> list[dict]: # Get summary of all clusters
-    clusters = _load_clusters()
-    summaries = []
-    for c in clusters:
-        reps = c.get("representatives", [])
-        cats = [r.get("category", "unknown") for r in reps]
-        top_cats = [cat for cat, _ in Counter(cats).most_common(3)]
-        previews = [r.get("image_url") for r in reps[:3] if r.get("image_url")]
-        summaries.append({"cluster_id": c["cluster_id"], "size": c["size"], "top_categories": top_cats, "preview_images": previews})
-    return sorted(summaries, key=lambda x: x["size"], reverse=True)
-
-def get_cluster_by_id(cluster_id: int) -> dict | None: # Get single cluster detail
-    clusters = _load_clusters()
-    for c in clusters:
-        if c["cluster_id"] == cluster_id:
-            return {"cluster_id": c["cluster_id"], "size": c["size"], "representatives": c.get("representatives", []), "center_embedding": c.get("center_embedding")}
-    return None
+    return _load_index().summaries
+
+def get_cluster_by_id(cluster_id: int, include_center: bool = True) -> dict | None: # Get single cluster detail
+    return _load_index().detail(cluster_id, include_center)
 
 def get_stats() -> dict: # Get system stats
-    clusters = _load_clusters()
-    total_images = sum(c["size"] for c in clusters)
-    cat_dist = Counter()
-    for c in clusters:
-        for r in c.get("representatives", []): cat_dist[r.get("category", "unknown")] += 1
-    return {"total_images": total_images, "total_clusters": len(clusters), "category_distribution": dict(cat_dist.most_common())}
+    return _load_index().stats
 
 def reload_clusters(): # Force reload clusters (if updated)
-    global _clusters_cache
-    _clusters_cache = None
-    return _load_clusters()
+    _build_if_changed()
+    return _load_index().clusters
+
+def _watch_loop(interval: float):
+    bad_stamp = None  # Warn once per unreadable file version, retry when it changes
+    while True:
+        stamp = None
+        try:
+            if _source().exists():
+                stamp = _stamp()  # Taken before loading: a commit that lands mid-load has a different stamp and is retried, not marked bad
+                if stamp != bad_stamp: _build_if_changed(stamp)
+        except (ValueError, KeyError, OSError) as e:
+            bad_stamp = stamp
+            print(f"⚠️ Clusters not loadable, keeping v{_index.version if _index else 0}: {e}")
+        time.sleep(interval)
 
+def start_watcher(interval: float = CLUSTERS_WATCH_SECONDS): # Daemon thread: initial load + hot reload on mtime/size change
+    global _watcher
+    if _watcher is None or not _watcher.is_alive():
+        _watcher = threading.Thread(target=_watch_loop, args=(interval,), daemon=True, name="clusters-watcher")
+        _watcher.start()
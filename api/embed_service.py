@@ -1,45 +1,264 @@
 import torch # Embedding service for API (lazy-loaded singleton)
-import open_clip
-from functools import lru_cache
+import asyncio, ipaddress, os, threading, sys
+import aiohttp
+from aiohttp.resolver import ThreadedResolver
+from yarl import URL
+import numpy as np
+from io import BytesIO
+from PIL import Image
+from collections import OrderedDict
+from concurrent.futures import Executor, ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable
+sys.path.insert(0, str(__file__).rsplit("/", 2)[0])
+from embedding.inference_backend import load_clip
+from embedding.image_cache import get_image_cache
+from api import ann_index
+from settings import CLIP_MODEL, CLIP_PRETRAINED, INFERENCE_BACKEND, TEXT_CACHE_SIZE, TEXT_CACHE_PATH, INFER_MAX_BATCH, INFER_BATCH_WINDOW_MS, INFER_WORKERS, DECODE_WORKERS, IMAGE_FETCH_CONCURRENCY, IMAGE_FETCH_TIMEOUT, IMAGE_FETCH_MAX_REDIRECTS, MAX_UPLOAD_BYTES
 
 _model, _preprocess, _tokenizer = None, None, None
+_model_lock = threading.Lock()
+_http: aiohttp.ClientSession | None = None
+PREPROCESS_SIZE = 224  # ViT-L-14 input resolution
+INFER_EXECUTOR = ThreadPoolExecutor(max_workers=INFER_WORKERS, thread_name_prefix="clip-infer")  # torch releases the GIL inside ops
+torch.set_num_threads(max(1, (os.cpu_count() or 1) // INFER_WORKERS))  # Workers × intra-op threads = cores
+DECODE_EXECUTOR = ThreadPoolExecutor(max_workers=DECODE_WORKERS, thread_name_prefix="img-decode")
+
+class EmbeddingLRU:  # Bounded, thread-safe LRU of query text → normalized embedding
+    def __init__(self, maxsize: int = TEXT_CACHE_SIZE):
+        self.maxsize, self.hits, self.misses = maxsize, 0, 0
+        self._data: OrderedDict[str, np.ndarray] = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def normalize(query: str) -> str:  # CLIP tokenizer lowercases + collapses whitespace, so these keys are embedding-equivalent
+        return " ".join(query.lower().split())
+
+    def get(self, key: str) -> np.ndarray | None:
+        with self._lock:
+            emb = self._data.get(key)
+            if emb is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return emb
+
+    def put(self, key: str, emb: np.ndarray):
+        with self._lock:
+            self._data[key] = emb
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize: self._data.popitem(last=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {"size": len(self._data), "maxsize": self.maxsize, "hits": self.hits, "misses": self.misses, "hit_rate": round(self.hits / total, 4) if total else 0.0}
+
+    def save(self, path: Path, model_id: str):  # LRU order is preserved (oldest first)
+        with self._lock: keys, embs = list(self._data.keys()), list(self._data.values())
+        if not keys: return
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(".tmp.npz")
+        np.savez(tmp, keys=np.array(keys), embeddings=np.stack(embs), model_id=np.array(model_id))
+        tmp.replace(path)
+
+    def load(self, path: Path, model_id: str) -> int:  # Ignore caches written by a different model
+        if not path.exists(): return 0
+        try:
+            with np.load(path) as f:
+                if str(f["model_id"]) != model_id: return 0
+                for key, emb in zip(f["keys"].tolist(), f["embeddings"]): self.put(key, emb)
+        except Exception as e:
+            print(f"⚠️ Ignoring unreadable text cache {path}: {e}")
+            return 0
+        return len(self._data)
+
+class MicroBatcher:  # Coalesce concurrent single-item requests into one forward pass
+    def __init__(self, run_batch: Callable[[list], list], executor: Executor = INFER_EXECUTOR, max_batch: int = INFER_MAX_BATCH, window_ms: float = INFER_BATCH_WINDOW_MS, max_inflight: int = INFER_WORKERS):
+        self.run_batch, self.executor, self.max_batch, self.window, self.max_inflight = run_batch, executor, max_batch, window_ms / 1000, max_inflight
+        self.batches, self.items = 0, 0
+        self._queue: asyncio.Queue | None = None
+        self._slots: asyncio.Semaphore | None = None
+        self._worker: asyncio.Task | None = None
+        self._inflight: set[asyncio.Task] = set()
+
+    async def submit(self, item):  # Await this item's result; the worker fans batch outputs back to each future
+        loop = asyncio.get_running_loop()
+        if self._worker is None or self._worker.done() or self._worker.get_loop() is not loop:
+            self._queue, self._slots = asyncio.Queue(), asyncio.Semaphore(self.max_inflight)
+            self._worker = loop.create_task(self._run())
+        fut = loop.create_future()
+        await self._queue.put((item, fut))
+        return await fut
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await self._slots.acquire()  # While every worker is busy, queued items keep piling into the next batch
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.window
+            while len(batch) < self.max_batch:  # Fill until window closes or batch is full
+                if not self._queue.empty():
+                    batch.append(self._queue.get_nowait())
+                    continue
+                timeout = deadline - loop.time()
+                if timeout <= 0: break
+                try: batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError: break
+            batch = [(item, fut) for item, fut in batch if not fut.cancelled()]
+            if not batch:
+                self._slots.release()
+                continue
+            task = loop.create_task(self._dispatch(batch))
+            self._inflight.add(task)
+            task.add_done_callback(self._inflight.discard)
+
+    async def _dispatch(self, batch: list[tuple]):  # Forward pass on the inference executor, never on the event loop
+        try:
+            try: results = await asyncio.get_running_loop().run_in_executor(self.executor, self.run_batch, [item for item, _ in batch])
+            except Exception as e:
+                for _, fut in batch:
+                    if not fut.done(): fut.set_exception(e)
+                return
+            self.batches += 1
+            self.items += len(batch)
+            for (_, fut), res in zip(batch, results):
+                if not fut.done(): fut.set_result(res)
+        finally: self._slots.release()
+
+    def stats(self) -> dict:
+        return {"batches": self.batches, "items": self.items, "avg_batch": round(self.items / self.batches, 2) if self.batches else 0.0}
+
+_text_cache = EmbeddingLRU()
+_MODEL_ID = f"{CLIP_MODEL}/{CLIP_PRETRAINED}/{INFERENCE_BACKEND}"  # Cached text vectors are backend-specific
 
 def _load_model(): # Lazy load model on first use
     global _model, _preprocess, _tokenizer
-    if _model is None:
-        device = "mps" if torch.backends.mps.is_available() else "cuda" if torch.cuda.is_available() else "cpu"
-        _model, _, _preprocess = open_clip.create_model_and_transforms("ViT-L-14", pretrained="laion2b_s32b_b82k", device=device)
-        _tokenizer = open_clip.get_tokenizer("ViT-L-14")
-        _model.eval()
+    if _model is not None: return _model, _preprocess, _tokenizer
+    with _model_lock:  # Inference workers may race on first use
+        if _model is not None: return _model, _preprocess, _tokenizer
+        _model, _preprocess, _tokenizer = load_clip(INFERENCE_BACKEND)
     return _model, _preprocess, _tokenizer
 
-def get_text_embedding(query: str) -> list[float]: # Encode text query to 768-dim vector
+def _encode_texts(queries: list[str]) -> list[np.ndarray]: # Run the text tower on a batch (cache miss path)
     model, _, tokenizer = _load_model()
-    device = next(model.parameters()).device
-    with torch.no_grad():
-        tokens = tokenizer([query]).to(device)
-        emb = model.encode_text(tokens)
-        emb = emb / emb.norm(dim=-1, keepdim=True)
-    return emb[0].cpu().tolist()
-
-async def get_image_embedding(image_url: str) -> list[float]: # Encode image URL to 768-dim vector
-    import aiohttp
-    from PIL import Image
-    from io import BytesIO
+    emb = model.encode_text(tokenizer(queries))
+    emb = emb / emb.norm(dim=-1, keepdim=True)
+    return list(emb.cpu().numpy())
+
+def _encode_images(images: list) -> list[np.ndarray]: # Run the image tower on a batch of PIL images
     model, preprocess, _ = _load_model()
-    device = next(model.parameters()).device
-    async with aiohttp.ClientSession() as session:
-        async with session.get(image_url, timeout=aiohttp.ClientTimeout(total=30)) as resp:
-            if resp.status != 200: raise ValueError(f"Failed to fetch image: {resp.status}")
-            data = await resp.read()
-    img = Image.open(BytesIO(data)).convert("RGB")
-    with torch.no_grad():
-        img_tensor = preprocess(img).unsqueeze(0).to(device)
-        emb = model.encode_image(img_tensor)
-        emb = emb / emb.norm(dim=-1, keepdim=True)
-    return emb[0].cpu().tolist()
+    emb = model.encode_image(torch.stack([preprocess(img) for img in images]))
+    emb = emb / emb.norm(dim=-1, keepdim=True)
+    return list(emb.cpu().numpy())
+
+_text_batcher = MicroBatcher(_encode_texts)
+_image_batcher = MicroBatcher(_encode_images)
+
+def get_text_embedding(query: str) -> list[float]: # Encode text query to 768-dim vector (LRU-cached, sync callers)
+    key = EmbeddingLRU.normalize(query)
+    emb = _text_cache.get(key)
+    if emb is None:
+        emb = _encode_texts([key])[0]
+        _text_cache.put(key, emb)
+    return emb.tolist()
+
+async def embed_text(query: str) -> list[float]: # Async variant: cache misses are coalesced with concurrent queries
+    key = EmbeddingLRU.normalize(query)
+    emb = _text_cache.get(key)
+    if emb is None:
+        emb = await _text_batcher.submit(key)
+        _text_cache.put(key, emb)
+    return emb.tolist()
+
+def cache_stats() -> dict: # Hit/miss counters for the text embedding cache
+    return _text_cache.stats()
+
+def batcher_stats() -> dict: # Micro-batching counters per tower
+    return {"backend": INFERENCE_BACKEND, "text": _text_batcher.stats(), "image": _image_batcher.stats()}
+
+def load_text_cache() -> int: # Restore persisted cache (startup)
+    return _text_cache.load(TEXT_CACHE_PATH, _MODEL_ID) if TEXT_CACHE_PATH else 0
+
+def save_text_cache(): # Persist cache (shutdown)
+    if TEXT_CACHE_PATH: _text_cache.save(TEXT_CACHE_PATH, _MODEL_ID)
+
+def _decode_image(data: bytes) -> Image.Image: # Runs on DECODE_EXECUTOR: reduced-size JPEG decode + shortest-side resize
+    img = Image.open(BytesIO(data))
+    img.draft("RGB", (PREPROCESS_SIZE * 2, PREPROCESS_SIZE * 2))  # JPEG DCT scaling: decode at >= 2x target instead of full res
+    img = img.convert("RGB")
+    scale = PREPROCESS_SIZE / min(img.size)
+    if scale < 1: img = img.resize((max(PREPROCESS_SIZE, round(img.width * scale)), max(PREPROCESS_SIZE, round(img.height * scale))), Image.BICUBIC)
+    return img
+
+class ImageTooLargeError(ValueError): pass  # Query image over MAX_UPLOAD_BYTES (router → 413)
+
+def _is_public(host: str) -> bool:
+    addr = ipaddress.ip_address(host.split("%", 1)[0])  # Drop an IPv6 zone id
+    if addr.version == 6 and addr.ipv4_mapped: addr = addr.ipv4_mapped
+    return addr.is_global and not addr.is_multicast
+
+class _PublicResolver(ThreadedResolver):  # Resolution happens at connect time, so a rebinding DNS answer is checked too
+    async def resolve(self, host: str, port: int = 0, family=0) -> list[dict]:
+        hosts = await super().resolve(host, port, family)
+        if not hosts or not all(_is_public(h["host"]) for h in hosts): raise OSError(f"{host} does not resolve to a public address")
+        return hosts
+
+def _check_url(url: URL):  # http(s) only; IP-literal hosts bypass the resolver, so they are checked here
+    if url.scheme not in ("http", "https") or not url.host: raise ValueError("Only http(s) image URLs are allowed")
+    try: literal = ipaddress.ip_address(url.host.split("%", 1)[0])
+    except ValueError: return
+    if not _is_public(str(literal)): raise ValueError("Image URL must point to a public address")
+
+def open_http_session(): # App-lifetime connection pool (startup); only ever fetches user-supplied URLs, so it can't reach private hosts
+    global _http
+    if _http is None or _http.closed:
+        _http = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=IMAGE_FETCH_CONCURRENCY, resolver=_PublicResolver()), timeout=aiohttp.ClientTimeout(total=IMAGE_FETCH_TIMEOUT), headers={"User-Agent": "Mozilla/5.0"})
+    return _http
+
+async def _download_image(image_url: str) -> bytes:  # Redirects followed by hand (each hop re-checked); body streamed and capped like uploads
+    url = URL(image_url)
+    for _ in range(IMAGE_FETCH_MAX_REDIRECTS + 1):
+        _check_url(url)
+        async with open_http_session().get(url, allow_redirects=False) as resp:
+            if resp.status in (301, 302, 303, 307, 308) and resp.headers.get("Location"):
+                url = resp.url.join(URL(resp.headers["Location"]))
+                continue
+            if resp.status != 200: raise ValueError(f"HTTP {resp.status}")
+            if (resp.content_length or 0) > MAX_UPLOAD_BYTES: raise ImageTooLargeError(f"Image larger than {MAX_UPLOAD_BYTES // (1024 * 1024)}MB")
+            data = bytearray()
+            async for chunk in resp.content.iter_chunked(1 << 16):
+                data += chunk
+                if len(data) > MAX_UPLOAD_BYTES: raise ImageTooLargeError(f"Image larger than {MAX_UPLOAD_BYTES // (1024 * 1024)}MB")
+            return bytes(data)
+    raise ValueError(f"More than {IMAGE_FETCH_MAX_REDIRECTS} redirects")
+
+async def close_http_session(): # Shutdown
+    if _http is not None and not _http.closed: await _http.close()
+
+async def embed_image_bytes(data: bytes) -> list[float]: # Decode off-loop, then share the image micro-batch path
+    img = await asyncio.get_running_loop().run_in_executor(DECODE_EXECUTOR, _decode_image, data)
+    emb = await _image_batcher.submit(img)
+    return emb.tolist()
+
+async def get_image_embedding(image_url: str) -> list[float]: # Encode image URL to 768-dim vector; only catalog URLs read through / fill the shared image cache
+    content_hash, cache = ann_index.catalog_hash(image_url), get_image_cache()
+    data = await asyncio.to_thread(cache.get, content_hash) if content_hash else None
+    if data is None:
+        data = await _download_image(image_url)
+        if content_hash:
+            try: data = await asyncio.to_thread(cache.put, content_hash, data)
+            except Exception: pass  # Not decodable: embed_image_bytes reports it
+    return await embed_image_bytes(data)
+
+def image_cache_stats() -> dict: # Shared image byte cache counters (this process)
+    return get_image_cache().stats()
 
 def warmup_model(): # Pre-load model on startup
     _load_model()
     return True
 
+def shutdown_executor(): # Stop inference + decode workers (shutdown)
+    INFER_EXECUTOR.shutdown(wait=False, cancel_futures=True)
+    DECODE_EXECUTOR.shutdown(wait=False, cancel_futures=True)
@@ -1,14 +1,31 @@
-from fastapi import FastAPI # Style Universe API - Visual Intelligence Service
+from fastapi import FastAPI, Request # Style Universe API - Visual Intelligence Service
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import FileResponse
+from contextlib import asynccontextmanager
 from pathlib import Path
+import asyncio
 import sys; sys.path.insert(0, str(__file__).rsplit("/", 2)[0])
 from api.routers import search, clusters
 from api.schemas import StatsResponse
-from api.cluster_service import get_stats
+from api.cluster_service import get_index_async, start_watcher
+from api.routers.clusters import etag_response
+from api.ann_index import start_background_refresh
+from api.embed_service import cache_stats, batcher_stats, image_cache_stats, load_text_cache, save_text_cache, warmup_model, shutdown_executor, open_http_session, close_http_session, INFER_EXECUTOR
 
-app = FastAPI(title="Style Universe API", description="Visual style embedding search & clustering service", version="1.0.0", docs_url="/docs", redoc_url="/redoc")
+@asynccontextmanager
+async def lifespan(app: FastAPI):  # Startup/shutdown hooks
+    start_background_refresh()  # ANN index builds off the request path; search falls back to pgvector until ready
+    start_watcher()  # Cluster artifact loaded + indexed off the request path, hot-swapped on change
+    load_text_cache()
+    open_http_session()
+    asyncio.get_running_loop().run_in_executor(INFER_EXECUTOR, warmup_model)  # Model loads in the background; /health answers immediately
+    yield
+    save_text_cache()
+    await close_http_session()
+    shutdown_executor()
+
+app = FastAPI(title="Style Universe API", description="Visual style embedding search & clustering service", version="1.0.0", docs_url="/docs", redoc_url="/redoc", lifespan=lifespan)
 app.add_middleware(CORSMiddleware, allow_origins=["*"], allow_credentials=True, allow_methods=["*"], allow_headers=["*"])
 
 app.include_router(search.router)
@@ -28,13 +45,28 @@ async def health():
     """Health check endpoint"""
     return {"status": "ok", "service": "style-universe"}
 
+_EMPTY_STATS = StatsResponse(total_images=0, total_clusters=0, category_distribution={})
+
 @app.get("/stats", response_model=StatsResponse)
-async def stats():
+async def stats(request: Request):
     """Get dataset statistics"""
-    try:
-        data = get_stats()
-        return StatsResponse(total_images=data["total_images"], total_clusters=data["total_clusters"], category_distribution=data["category_distribution"])
-    except: return StatsResponse(total_images=0, total_clusters=0, category_distribution={})
+    try: return etag_response(request, (await get_index_async()).stats_body)
+    except: return _EMPTY_STATS
+
+@app.get("/stats/cache")
+async def embedding_cache_stats():
+    """Text embedding cache hit/miss counters"""
+    return cache_stats()
+
+@app.get("/stats/images")
+async def image_cache_stats_endpoint():
+    """Shared image byte cache size and hit rate"""
+    return image_cache_stats()
+
+@app.get("/stats/inference")
+async def inference_stats():
+    """Micro-batching counters (avg_batch > 1 means requests are being coalesced)"""
+    return batcher_stats()
 
 if __name__ == "__main__":
     import uvicorn
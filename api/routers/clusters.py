@@ -1,27 +1,31 @@
-from fastapi import APIRouter, HTTPException # Cluster endpoints
+from fastapi import APIRouter, HTTPException, Request, Response # Cluster endpoints
 import sys; sys.path.insert(0, str(__file__).rsplit("/", 3)[0])
 from api.schemas import ClusterSummary, ClusterDetail
-from api.cluster_service import get_all_clusters, get_cluster_by_id
+from api.cluster_service import get_index_async
 
 router = APIRouter(prefix="/clusters", tags=["clusters"])
 
+def etag_response(request: Request, payload: tuple[bytes, str]) -> Response:  # Pre-serialized body; 304 when the client's copy is current
+    body, etag = payload
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if request.headers.get("if-none-match") == etag: return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
 @router.get("", response_model=list[ClusterSummary])
-async def list_clusters():
+async def list_clusters(request: Request):
     """List all clusters with summary info"""
     try:
-        clusters = get_all_clusters()
-        return [ClusterSummary(cluster_id=c["cluster_id"], size=c["size"], top_categories=c["top_categories"]) for c in clusters]
+        return etag_response(request, (await get_index_async()).summaries_body)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/{cluster_id}", response_model=ClusterDetail)
-async def get_cluster(cluster_id: int):
-    """Get detailed info for a specific cluster"""
+async def get_cluster(cluster_id: int, request: Request, include_center: bool = False):
+    """Get detailed info for a specific cluster (center_embedding only with ?include_center=true)"""
     try:
-        cluster = get_cluster_by_id(cluster_id)
-        if not cluster: raise HTTPException(status_code=404, detail=f"Cluster {cluster_id} not found")
-        return ClusterDetail(cluster_id=cluster["cluster_id"], size=cluster["size"], representatives=cluster["representatives"])
+        payload = (await get_index_async()).detail_body(cluster_id, include_center)
+        if not payload: raise HTTPException(status_code=404, detail=f"Cluster {cluster_id} not found")
+        return etag_response(request, payload)
     except HTTPException: raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
-
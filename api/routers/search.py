@@ -1,19 +1,66 @@
-from fastapi import APIRouter, HTTPException # Search endpoints
+from fastapi import APIRouter, HTTPException, UploadFile, File, Form # Search endpoints
+import asyncio
 import sys; sys.path.insert(0, str(__file__).rsplit("/", 3)[0])
-from api.schemas import TextSearchRequest, SearchResponse, ImageResult
-from api.embed_service import get_text_embedding
+from api.schemas import TextSearchRequest, ImageSearchRequest, SearchFilters, SearchResponse, ImageResult
+from api.embed_service import embed_text, get_image_embedding, embed_image_bytes, ImageTooLargeError
+from api import ann_index
+from settings import MAX_UPLOAD_BYTES
 from vector_db.supabase_client import search_similar
 
 router = APIRouter(prefix="/search", tags=["search"])
 
+async def _knn(emb: list[float], k: int, filters: SearchFilters | None = None) -> list[ImageResult]:  # Shared top-k path for text and image queries
+    f = filters.model_dump(exclude_none=True) if filters else None
+    raw = await asyncio.to_thread(ann_index.search, emb, k, f)  # NumPy matmul releases the GIL
+    if raw is None: raw = await asyncio.to_thread(search_similar, emb, k, f)  # Index still building → pgvector (blocking client, off-loop)
+    return [ImageResult(content_hash=r["content_hash"], image_url=r["image_url"], category=r["category"], category_type=r["category_type"], similarity=r["similarity"]) for r in raw]
+
 @router.post("/text", response_model=SearchResponse)
 async def search_by_text(req: TextSearchRequest):
     """Text-to-image similarity search"""
     try:
-        emb = get_text_embedding(req.query)
-        raw = search_similar(emb, limit=req.k)
-        results = [ImageResult(content_hash=r["content_hash"], image_url=r["image_url"], category=r["category"], category_type=r["category_type"], similarity=r["similarity"]) for r in raw]
+        results = await _knn(await embed_text(req.query), req.k, req.filters)
         return SearchResponse(query=req.query, count=len(results), results=results)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.post("/image", response_model=SearchResponse)
+async def search_by_image_url(req: ImageSearchRequest):
+    """Reverse-image search from an image URL"""
+    try: emb = await get_image_embedding(req.image_url)
+    except ImageTooLargeError as e: raise HTTPException(status_code=413, detail=str(e))
+    except Exception as e: raise HTTPException(status_code=400, detail=f"Could not load image: {e}")
+    try:
+        results = await _knn(emb, req.k, req.filters)
+        return SearchResponse(query=req.image_url, count=len(results), results=results)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/image/upload", response_model=SearchResponse)
+async def search_by_image_upload(file: UploadFile = File(...), k: int = Form(20, ge=1, le=100), filters: str | None = Form(None)):
+    """Reverse-image search from an uploaded file (filters = SearchFilters as a JSON string)"""
+    try: parsed = SearchFilters.model_validate_json(filters) if filters else None
+    except ValueError as e: raise HTTPException(status_code=422, detail=f"Invalid filters: {e}")
+    data = await file.read(MAX_UPLOAD_BYTES + 1)
+    if len(data) > MAX_UPLOAD_BYTES: raise HTTPException(status_code=413, detail=f"Image larger than {MAX_UPLOAD_BYTES // (1024 * 1024)}MB")
+    try: emb = await embed_image_bytes(data)
+    except Exception as e: raise HTTPException(status_code=400, detail=f"Could not decode image: {e}")
+    try:
+        results = await _knn(emb, k, parsed)
+        return SearchResponse(query=file.filename or "upload", count=len(results), results=results)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/index")
+async def index_status():
+    """In-process ANN index status"""
+    return ann_index.index_info()
+
+@router.post("/index/reload")
+def reload_index():
+    """Sync the local snapshot and hot-swap the ANN index"""
+    try:
+        ann_index.build_index(sync=True)
+        return ann_index.index_info()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
@@ -1,10 +1,22 @@
 from pydantic import BaseModel, Field # API request/response schemas
-from typing import Optional
+from typing import Optional, Union
+
+class SearchFilters(BaseModel): # Predicates applied inside the index scan (single value or list = IN)
+    category: Optional[Union[str, list[str]]] = None
+    category_type: Optional[Union[str, list[str]]] = None
+    source: Optional[Union[str, list[str]]] = None
+    cluster_id: Optional[Union[int, list[int]]] = None
+    min_aesthetic: Optional[float] = Field(None, ge=0, le=5)
 
 class TextSearchRequest(BaseModel): # POST /search/text
     query: str = Field(..., min_length=1, max_length=500)
     k: int = Field(20, ge=1, le=100)
-    filters: Optional[dict] = None
+    filters: Optional[SearchFilters] = None
+
+class ImageSearchRequest(BaseModel): # POST /search/image
+    image_url: str = Field(..., min_length=1, max_length=2000)
+    k: int = Field(20, ge=1, le=100)
+    filters: Optional[SearchFilters] = None
 
 class ImageResult(BaseModel): # Single image result
     content_hash: str
@@ -27,6 +39,7 @@ class ClusterDetail(BaseModel): # Full cluster detail
     cluster_id: int
     size: int
     representatives: list[dict]
+    center_embedding: Optional[list[float]] = None  # Only with ?include_center=true
 
 class StatsResponse(BaseModel): # GET /stats
     total_images: int
@@ -0,0 +1,79 @@
+import sys, threading # Nearest-center cluster_id for newly embedded images: one matmul per batch, bulk write-back, incremental cluster sizes
+import numpy as np
+sys.path.insert(0, str(__file__).rsplit("/", 2)[0])
+from embedding.config_embed import CLUSTERS_ARTIFACT, ASSIGN_FLUSH_ROWS
+from clustering.cluster_artifact import load_cluster_artifact, artifact_generation, append_assignments
+
+class ClusterAssigner:
+    """Centers loaded once, unit-normalized: embeddings are unit-norm, so the nearest center is argmax of one (n, D) x (D, K) product.
+    record() buffers committed labels; every flush_rows they are appended to the artifact's assigned delta (O(flush_rows) I/O),
+    which the API hot-reloads into cluster sizes."""
+    def __init__(self, root=CLUSTERS_ARTIFACT, flush_rows: int = ASSIGN_FLUSH_ROWS):
+        self.root, self.flush_rows = root, flush_rows
+        artifact = load_cluster_artifact(root)
+        self.generation = artifact.meta["generation"]
+        self.cluster_ids = np.array(artifact.cluster_ids)
+        self._centers = np.array(artifact.centers, dtype=np.float32)
+        self.unit_centers = self._centers / np.linalg.norm(self._centers, axis=1, keepdims=True)
+        self._hashes, self._labels = [], []
+        self._lock = threading.Lock()
+        print(f"🧭 Assigning new images to {len(self.cluster_ids)} clusters (generation {self.generation})")
+
+    def assign(self, embeddings: np.ndarray) -> np.ndarray:  # (n, D) → (n,) cluster_id
+        return self.cluster_ids[np.argmax(np.asarray(embeddings, dtype=np.float32) @ self.unit_centers.T, axis=1)]
+
+    def record(self, records: list[dict]):  # Committed upsert chunk carrying cluster_id (bulk_upsert on_chunk; may run on a pool thread)
+        with self._lock:
+            for r in records:
+                if r.get("cluster_id") is not None:
+                    self._hashes.append(r["content_hash"]); self._labels.append(r["cluster_id"])
+            if len(self._hashes) >= self.flush_rows: self._flush()
+
+    def flush(self):
+        with self._lock: self._flush()
+
+    def _flush(self):
+        if not self._hashes: return
+        current = artifact_generation(self.root)
+        hashes, labels, self._hashes, self._labels = self._hashes, self._labels, [], []
+        if current != self.generation:  # A new generation was committed: fine if the centers are the same, stale if they moved
+            if not self._same_centers():
+                print(f"⚠️ Clusters were refit mid-run; {len(hashes)} labels left for clustering.incremental_kmeans to fold in")
+                return
+            self.generation = current
+        append_assignments(hashes, np.asarray(labels, dtype=np.int32), self.root)
+
+    def _same_centers(self) -> bool:  # A refit / incremental update usually replaces the centers
+        artifact = load_cluster_artifact(self.root)
+        return np.array_equal(artifact.cluster_ids, self.cluster_ids) and np.array_equal(artifact.centers, self._centers)
+
+def assign_and_write_back(hashes: list[str], embeddings: np.ndarray, update_db: bool = True) -> np.ndarray:  # Label already-uploaded vectors: bulk cluster_id write-back + artifact sizes
+    from vector_db.bulk_upsert import bulk_update_clusters
+    assigner = ClusterAssigner()
+    labels = assigner.assign(embeddings)
+    if update_db:
+        success = bulk_update_clusters(list(zip(hashes, labels.tolist())))
+        print(f"   Updated {success}/{len(hashes)} records")
+    append_assignments(hashes, labels)
+    return labels
+
+def main():
+    import argparse
+    from vector_db.local_store import LocalEmbeddingStore
+    parser = argparse.ArgumentParser(description="Assign unclustered images to their nearest cluster center (no refit)")
+    parser.add_argument("--no-db-update", action="store_true", help="Only update the local cluster artifact")
+    parser.add_argument("--no-sync", action="store_true", help="Use local embedding store as-is (skip Supabase sync)")
+    args = parser.parse_args()
+    store = LocalEmbeddingStore()
+    if not args.no_sync or not store.exists(): store.sync()
+    labeled = load_cluster_artifact().label_map()
+    hashes = store.hashes()
+    idx = np.array([i for i, h in enumerate(hashes) if h not in labeled], dtype=np.int64)
+    print(f"📊 {len(idx)} of {len(hashes)} images have no cluster")
+    if not len(idx): return
+    labels = assign_and_write_back([hashes[i] for i in idx], store.embeddings()[idx], update_db=not args.no_db_update)
+    if not args.no_db_update: store.set_attribute("cluster_id", dict(zip((hashes[i] for i in idx), labels.tolist())))
+    print(f"✅ Assigned {len(idx)} images across {len(np.unique(labels))} clusters")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""Per-cluster loop vs single-pass extract_representatives on synthetic clustered data (100k and 1M points by default)"""
+import json, sys, time
+import numpy as np
+sys.path.insert(0, str(__file__).rsplit("/", 2)[0])
+from embedding.config_embed import OUTPUT_DIR, EMBED_DIM, DEFAULT_K, CLUSTER_REPRESENTATIVES
+from clustering.kmeans_cluster import extract_representatives
+
+def extract_representatives_loop(hashes, embeddings, labels, centers, data, n=CLUSTER_REPRESENTATIVES) -> list[dict]:  # Previous implementation (one mask + full copies per cluster), kept as the reference
+    clusters = []
+    for cluster_id in sorted(set(labels)):
+        mask = labels == cluster_id
+        cluster_hashes = np.array(hashes)[mask]
+        cluster_embs = embeddings[mask]
+        cluster_data = [d for d, m in zip(data, mask) if m]
+        dists = np.linalg.norm(cluster_embs - centers[cluster_id], axis=1)
+        top_indices = np.argsort(dists)[:n]
+        reps = [{"content_hash": cluster_hashes[i], "image_url": cluster_data[i]["image_url"], "category": cluster_data[i]["category"], "distance": float(dists[i])} for i in top_indices]
+        clusters.append({"cluster_id": int(cluster_id), "size": int(mask.sum()), "center_embedding": centers[cluster_id].tolist(), "representatives": reps})
+    return clusters
+
+def synthetic(n: int, k: int, dim: int, seed: int = 0) -> tuple[list[str], np.ndarray, np.ndarray, np.ndarray, list[dict]]:  # Unit-norm points around k random centers, built blockwise
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(k, dim)).astype(np.float32)
+    centers /= np.linalg.norm(centers, axis=1, keepdims=True)
+    labels = rng.integers(0, k, n)
+    x = np.empty((n, dim), dtype=np.float32)
+    for i in range(0, n, 65536):
+        xb = centers[labels[i:i + 65536]] + rng.normal(scale=0.05, size=(len(labels[i:i + 65536]), dim)).astype(np.float32)
+        x[i:i + 65536] = xb / np.linalg.norm(xb, axis=1, keepdims=True)
+    hashes = [f"{i:012x}" for i in range(n)]
+    return hashes, x, labels, centers, [{"image_url": f"https://example.com/{h}.jpg", "category": "bench"} for h in hashes]
+
+def run_bench(sizes: list[int], k: int, dim: int, skip_loop_above: int) -> list[dict]:
+    results = []
+    for n in sizes:
+        hashes, x, labels, centers, data = synthetic(n, k, dim)
+        t0 = time.perf_counter()
+        fast = extract_representatives(hashes, x, labels, centers, data)
+        r = {"n": n, "k": k, "dim": dim, "single_pass_s": round(time.perf_counter() - t0, 3)}
+        if n <= skip_loop_above:
+            t0 = time.perf_counter()
+            ref = extract_representatives_loop(hashes, x, labels, centers, data)
+            r["loop_s"] = round(time.perf_counter() - t0, 3)
+            r["speedup"] = round(r["loop_s"] / r["single_pass_s"], 1)
+            r["identical"] = [[p["content_hash"] for p in c["representatives"]] for c in fast] == [[str(p["content_hash"]) for p in c["representatives"]] for c in ref]
+        results.append(r)
+        print(f"   N={n:>9,}  single-pass {r['single_pass_s']:>7.2f}s" + (f"  loop {r['loop_s']:>8.2f}s  x{r['speedup']:<6} same reps: {r['identical']}" if "loop_s" in r else "  (loop skipped)"))
+        del hashes, x, labels, data
+    return results
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description="Benchmark extract_representatives: per-cluster loop vs single pass")
+    parser.add_argument("--sizes", default="100000,1000000", help="Comma-separated point counts")
+    parser.add_argument("--k", type=int, default=DEFAULT_K)
+    parser.add_argument("--dim", type=int, default=EMBED_DIM, help="Lower it if N x dim float32 doesn't fit in RAM")
+    parser.add_argument("--skip-loop-above", type=int, default=10**7, help="Only time the single pass above this N")
+    args = parser.parse_args()
+    print(f"⏱️ extract_representatives, K={args.k}, dim={args.dim}")
+    results = run_bench([int(s) for s in args.sizes.split(",")], args.k, args.dim, args.skip_loop_above)
+    out = OUTPUT_DIR / "bench_representatives.json"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    with open(out, "w") as f: json.dump(results, f, indent=2)
+    print(f"💾 Saved: {out}")
+
+if __name__ == "__main__":
+    main()
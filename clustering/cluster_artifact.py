@@ -0,0 +1,126 @@
+import json, os, sys, time # Binary cluster artifact: float32 centers + labels as memmappable .npy, small JSON meta
+import numpy as np
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from settings import CLUSTERS_ARTIFACT, CLUSTERS_JSON
+
+ARRAYS = ["centers", "cluster_ids", "sizes", "labels", "hashes"]
+
+class ClusterArtifact:
+    """meta.json is the commit point: it names the generation of every .npy, so a reader never mixes two runs.
+    Labels assigned after the fit live in an append-only assigned.<gen>.tsv; meta["assigned_bytes"] is its committed length."""
+    def __init__(self, root: Path = CLUSTERS_ARTIFACT):
+        self.root = Path(root)
+        self.meta_path = self.root / "meta.json"
+        with open(self.meta_path) as f: self.meta = json.load(f)
+        gen = self.meta["generation"]
+        arrays = {name: np.load(self.root / f"{name}.{gen}.npy", mmap_mode="r") for name in ARRAYS if (self.root / f"{name}.{gen}.npy").exists()}
+        self.centers = arrays["centers"]          # (K, D) float32
+        self.cluster_ids = arrays["cluster_ids"]  # (K,) int32
+        self.base_sizes = arrays["sizes"]         # (K,) int64, points in the fit
+        self.labels = arrays.get("labels")        # (N,) int32, aligned with hashes (fit points only)
+        self.hashes = arrays.get("hashes")        # (N,) unicode content_hash (sorted when meta["hashes_sorted"])
+        self.representatives: dict[int, list[dict]] = {int(k): v for k, v in self.meta["representatives"].items()}
+        self.assigned = self._read_assigned()     # content_hash → cluster_id labelled since the fit (last write wins)
+        self.sizes = self._live_sizes()           # (K,) int64, fit + assigned
+
+    def _read_assigned(self) -> dict[str, int]:  # Only the committed prefix: an append in progress is invisible until meta.json moves
+        n = self.meta.get("assigned_bytes", 0)
+        if not n: return {}
+        with open(self.root / f"assigned.{self.meta['generation']}.tsv", "rb") as f: data = f.read(n)
+        out = {}
+        for line in data.decode().splitlines():
+            h, label = line.split("\t")
+            out[h] = int(label)
+        return out
+
+    def _base_labels(self, hashes: np.ndarray) -> np.ndarray:  # Fit label per hash, -1 if the hash wasn't in the fit
+        if self.hashes is None or not len(self.hashes): return np.full(len(hashes), -1, dtype=np.int64)
+        if self.meta.get("hashes_sorted"):  # Binary search over the memmap: touches O(len(hashes) log N) pages
+            pos = np.minimum(np.searchsorted(self.hashes, hashes), len(self.hashes) - 1)
+            return np.where(self.hashes[pos] == hashes, self.labels[pos], -1).astype(np.int64)
+        fit = dict(zip(self.hashes.tolist(), self.labels.tolist()))
+        return np.array([fit.get(h, -1) for h in hashes.tolist()], dtype=np.int64)
+
+    def _live_sizes(self) -> np.ndarray:  # Fit sizes moved by the assigned delta (a relabelled fit point leaves its old cluster)
+        sizes = np.array(self.base_sizes, dtype=np.int64)
+        if not self.assigned: return sizes
+        row = np.full(int(self.cluster_ids.max()) + 1, -1, dtype=np.int64)
+        row[np.asarray(self.cluster_ids)] = np.arange(len(self.cluster_ids))
+        prior = self._base_labels(np.asarray(list(self.assigned), dtype=str))
+        np.subtract.at(sizes, row[prior[prior >= 0]], 1)
+        np.add.at(sizes, row[np.fromiter(self.assigned.values(), dtype=np.int64, count=len(self.assigned))], 1)
+        return sizes
+
+    def to_dicts(self, include_center: bool = False) -> list[dict]:  # clusters.json-shaped records (center rows stay memmap views)
+        out = []
+        for row, (cid, size) in enumerate(zip(self.cluster_ids.tolist(), self.sizes.tolist())):
+            d = {"cluster_id": cid, "size": size, "representatives": self.representatives.get(cid, [])}
+            if include_center: d["center_embedding"] = self.centers[row]
+            out.append(d)
+        return out
+
+    def label_map(self, include_assigned: bool = True) -> dict[str, int]:  # content_hash → cluster_id for every clustered point
+        fit = {} if self.labels is None else dict(zip(self.hashes.tolist(), self.labels.tolist()))
+        if include_assigned: fit.update(self.assigned)
+        return fit
+
+def artifact_exists(root: Path = CLUSTERS_ARTIFACT) -> bool:
+    return (Path(root) / "meta.json").exists()
+
+def artifact_generation(root: Path = CLUSTERS_ARTIFACT) -> str:  # Current generation from meta.json alone (no arrays, no delta)
+    with open(Path(root) / "meta.json") as f: return json.load(f)["generation"]
+
+def load_cluster_artifact(root: Path = CLUSTERS_ARTIFACT) -> ClusterArtifact:
+    if not artifact_exists(root): raise FileNotFoundError(f"Cluster artifact not found at {root} (run clustering.kmeans_cluster)")
+    return ClusterArtifact(root)
+
+def load_cluster_dicts(include_center: bool = False) -> list[dict]:  # Artifact if present, else legacy clusters.json
+    if artifact_exists(): return load_cluster_artifact().to_dicts(include_center)
+    if not CLUSTERS_JSON.exists(): raise FileNotFoundError(f"No clusters found: {CLUSTERS_ARTIFACT} or {CLUSTERS_JSON}")
+    with open(CLUSTERS_JSON) as f: return json.load(f)
+
+def save_cluster_artifact(clusters: list[dict], centers: np.ndarray, labels: np.ndarray | None = None, hashes: list[str] | None = None, extra_meta: dict | None = None, root: Path = CLUSTERS_ARTIFACT) -> Path:
+    ids = np.array([c["cluster_id"] for c in clusters], dtype=np.int32)
+    arrays = {"centers": np.asarray(centers, dtype=np.float32)[ids], "cluster_ids": ids, "sizes": np.array([c["size"] for c in clusters], dtype=np.int64)}
+    if labels is not None:  # Stored sorted by hash so assigned labels can be matched against the fit by binary search
+        hashes = np.asarray(hashes, dtype=str)
+        order = np.argsort(hashes, kind="stable")
+        arrays.update({"labels": np.asarray(labels, dtype=np.int32)[order], "hashes": hashes[order]})
+    meta = {"k": len(clusters), "dim": int(arrays["centers"].shape[1]), "n_points": int(len(labels)) if labels is not None else None, "hashes_sorted": True,
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"), "representatives": {str(c["cluster_id"]): c.get("representatives", []) for c in clusters}, **(extra_meta or {})}
+    return _commit(Path(root), arrays, meta)
+
+def _write_meta(root: Path, meta: dict):  # tmp + os.replace: the commit point for generations and assigned appends alike
+    tmp = root / "meta.tmp.json"
+    with open(tmp, "w") as f: json.dump(meta, f)
+    os.replace(tmp, root / "meta.json")
+
+def _commit(root: Path, arrays: dict[str, np.ndarray], meta: dict) -> Path:  # Write a new generation of every array, then swap meta.json
+    root.mkdir(parents=True, exist_ok=True)
+    prev = artifact_generation(root) if artifact_exists(root) else None
+    gen = time.strftime("%Y%m%d%H%M%S") + f"-{time.time_ns() % 10**9:09d}"  # Unique per run: never overwrite a file a reader may have mapped
+    for name, arr in arrays.items(): np.save(root / f"{name}.{gen}.npy", arr)
+    _write_meta(root, {**meta, "generation": gen})  # Commit (a new generation starts with no assigned delta)
+    if prev and prev != gen:  # Open memmaps of the old generation stay valid after unlink
+        for name in ARRAYS: (root / f"{name}.{prev}.npy").unlink(missing_ok=True)
+        (root / f"assigned.{prev}.tsv").unlink(missing_ok=True)
+    return root
+
+def append_assignments(hashes: list[str], labels: np.ndarray, root: Path = CLUSTERS_ARTIFACT) -> int:
+    """Record nearest-center labels for new (or re-embedded) points without rewriting the generation: the rows are appended to
+    assigned.<gen>.tsv and meta.json is swapped to commit the new length, so each call costs O(len(hashes)) I/O. Readers fold the
+    delta into sizes and label_map() at load; the next fit starts a new generation without it. Returns the rows now in the delta.
+    meta["assigned"] counts those rows; clustering.incremental_kmeans warm-starts from the fit alone and treats them as new."""
+    root = Path(root)
+    with open(root / "meta.json") as f: meta = json.load(f)
+    committed = meta.get("assigned_bytes", 0)
+    data = "".join(f"{h}\t{int(label)}\n" for h, label in zip(hashes, np.asarray(labels).tolist())).encode()
+    with open(root / f"assigned.{meta['generation']}.tsv", "a+b") as f:
+        f.truncate(committed)  # Drop an uncommitted tail left by an interrupted append
+        f.seek(committed)
+        f.write(data)
+        f.flush(); os.fsync(f.fileno())
+    meta.update({"assigned": meta.get("assigned", 0) + len(hashes), "assigned_bytes": committed + len(data), "assigned_at": time.strftime("%Y-%m-%dT%H:%M:%S")})
+    _write_meta(root, meta)
+    return meta["assigned"]
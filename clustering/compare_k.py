@@ -1,50 +1,114 @@
-import sys # Compare K values using silhouette score and inertia
+import json, os, sys, tempfile, time # Compare K values using silhouette score and inertia (parallel sweep, shared silhouette distances)
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import numpy as np
-from sklearn.cluster import KMeans
-from sklearn.metrics import silhouette_score
+from sklearn.cluster import KMeans, MiniBatchKMeans
+from sklearn.metrics import pairwise_distances, silhouette_score
 sys.path.insert(0, str(__file__).rsplit("/", 2)[0])
-from embedding.config_embed import K_CANDIDATES
+from embedding.config_embed import K_CANDIDATES, OUTPUT_DIR, MINIBATCH_SIZE, SWEEP_WORKERS, SILHOUETTE_SAMPLE
 from clustering.kmeans_cluster import load_embeddings
 
-def compare_k_values(embeddings: np.ndarray, k_values: list[int] = K_CANDIDATES) -> dict:  # Run K-means for each K and compute metrics
-    print(f"🔍 Comparing K values: {k_values}")
+SWEEP_JSON = OUTPUT_DIR / "compare_k.json"  # Rewritten after every finished K, so a long sweep can be watched / interrupted
+
+def _open(source: tuple) -> np.ndarray:  # Worker side: map the parent's matrix read-only instead of pickling N x D per task
+    path, offset, shape, dtype = source
+    return np.memmap(path, dtype=dtype, mode="r", offset=offset, shape=shape)
+
+def _fit(source: tuple, k: int, mode: str, n_init: int, threads: int) -> tuple[int, float, np.ndarray, float]:  # (k, inertia, labels, seconds)
+    from threadpoolctl import threadpool_limits
+    x = _open(source)
+    t0 = time.perf_counter()
+    with threadpool_limits(threads):  # Workers split the cores instead of each grabbing all of them
+        model = (MiniBatchKMeans(n_clusters=k, random_state=42, n_init=n_init, batch_size=MINIBATCH_SIZE) if mode == "minibatch"
+                 else KMeans(n_clusters=k, random_state=42, n_init=n_init, max_iter=300))
+        labels = model.fit_predict(x)
+    return k, float(model.inertia_), labels.astype(np.int32), time.perf_counter() - t0
+
+def _shareable(embeddings: np.ndarray) -> tuple[tuple, str | None]:  # ((path, offset, shape, dtype), temp file to delete)
+    if isinstance(embeddings, np.memmap) and embeddings.filename and embeddings.flags.c_contiguous:  # Local store memmap: workers map the same file
+        return (embeddings.filename, embeddings.offset, embeddings.shape, embeddings.dtype.str), None
+    OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(suffix=".npy", dir=OUTPUT_DIR)
+    os.close(fd)
+    np.save(tmp, np.ascontiguousarray(embeddings, dtype=np.float32))
+    m = np.load(tmp, mmap_mode="r")
+    return (tmp, m.offset, m.shape, m.dtype.str), tmp
+
+def compare_k_values(embeddings: np.ndarray, k_values: list[int] = K_CANDIDATES, mode: str = "full", n_init: int = None, workers: int = SWEEP_WORKERS,
+                     sample_size: int = SILHOUETTE_SAMPLE, on_result=None) -> dict:  # Run K-means for each K in a process pool and compute metrics
+    """mode="minibatch" is the coarse scan (MiniBatchKMeans over the full data); "full" the final comparison. Results stream through on_result(k, result)
+    as fits finish. The silhouette sample and its pairwise distances are drawn/computed once and reused for every K."""
+    n_init = n_init or (3 if mode == "minibatch" else 10)
+    workers = max(1, min(workers, len(k_values)))
+    print(f"🔍 Comparing K values: {k_values} ({mode}, n_init={n_init}, {workers} workers)")
+    sample = np.sort(np.random.default_rng(42).choice(len(embeddings), min(sample_size, len(embeddings)), replace=False))
+    t0 = time.perf_counter()
+    dist = pairwise_distances(np.asarray(embeddings[sample], dtype=np.float32), n_jobs=1)  # Shared by every K's silhouette
+    np.fill_diagonal(dist, 0)  # float32 rounding leaves ~1e-4 on the diagonal; precomputed silhouette requires exact zeros
+    print(f"   Silhouette distances: {len(sample)}² in {time.perf_counter() - t0:.1f}s")
+    source, tmp = _shareable(embeddings)
+    threads = max(1, (os.cpu_count() or 1) // workers)
     results = {}
-    
-    for k in k_values:
-        print(f"\n   K={k}...")
-        kmeans = KMeans(n_clusters=k, random_state=42, n_init=10, max_iter=300)
-        labels = kmeans.fit_predict(embeddings)
-        
-        sil = silhouette_score(embeddings, labels, sample_size=min(10000, len(embeddings)))  # Sample for speed
-        results[k] = {"inertia": float(kmeans.inertia_), "silhouette": float(sil), "labels": labels}
-        print(f"      Inertia: {kmeans.inertia_:.2f}, Silhouette: {sil:.4f}")
-    
+    try:
+        with ProcessPoolExecutor(workers, mp_context=mp.get_context("spawn")) as pool:  # spawn: children don't inherit the parent's BLAS thread pools
+            futures = [pool.submit(_fit, source, k, mode, n_init, threads) for k in sorted(k_values, reverse=True)]  # Largest K first: slowest fits start earliest
+            for future in as_completed(futures):
+                k, inertia, labels, seconds = future.result()
+                sil = silhouette_score(dist, labels[sample], metric="precomputed")
+                results[k] = {"inertia": inertia, "silhouette": float(sil), "labels": labels, "fit_seconds": round(seconds, 1)}
+                print(f"   K={k}: Inertia {inertia:.2f}, Silhouette {sil:.4f} ({seconds:.0f}s)")
+                if on_result: on_result(k, results[k])
+    finally:
+        if tmp: os.unlink(tmp)
     return results
 
+def save_results(results: dict, mode: str, path=SWEEP_JSON):  # Metrics only (no labels), tmp + rename
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".tmp.json")
+    with open(tmp, "w") as f: json.dump({"mode": mode, "results": {str(k): {m: v for m, v in r.items() if m != "labels"} for k, r in sorted(results.items())}}, f, indent=2)
+    tmp.replace(path)
+
 def print_report(results: dict):  # Print comparison report
     print("\n" + "="*60)
     print("📊 K-VALUE COMPARISON REPORT")
     print("="*60)
     print(f"{'K':<10} {'Inertia':<15} {'Silhouette':<12} {'Recommendation'}")
     print("-"*60)
-    
+
     best_sil_k = max(results.keys(), key=lambda k: results[k]["silhouette"])
     for k in sorted(results.keys()):
         r = results[k]
         rec = "⭐ BEST" if k == best_sil_k else ""
         print(f"{k:<10} {r['inertia']:<15.2f} {r['silhouette']:<12.4f} {rec}")
-    
+
     print("-"*60)
     print(f"💡 Recommendation: K={best_sil_k} has highest silhouette score")
     print("="*60)
 
+def parse_k(spec: str) -> list[int]:  # "80,120,160" or a range "40:200:20" (start:stop:step, stop inclusive)
+    if ":" in spec:
+        start, stop, step = (int(v) for v in spec.split(":"))
+        return list(range(start, stop + 1, step))
+    return [int(v) for v in spec.split(",")]
+
 def main():
-    _, embeddings, _ = load_embeddings()
-    results = compare_k_values(embeddings)
+    import argparse
+    parser = argparse.ArgumentParser(description="Compare K values (parallel sweep)")
+    parser.add_argument("--k", default=",".join(map(str, K_CANDIDATES)), help="K list '80,120,160' or range '40:200:20'")
+    parser.add_argument("--coarse", action="store_true", help="MiniBatchKMeans fits (fast scan of a wide K range)")
+    parser.add_argument("--n-init", type=int, help="Restarts per K (default 10 full, 3 coarse)")
+    parser.add_argument("--workers", type=int, default=SWEEP_WORKERS, help="Parallel fits")
+    parser.add_argument("--no-sync", action="store_true", help="Use local embedding store as-is (skip Supabase sync)")
+    args = parser.parse_args()
+    mode = "minibatch" if args.coarse else "full"
+    _, embeddings, _ = load_embeddings(sync=not args.no_sync)
+    results = {}
+    def record(k, r):
+        results[k] = r
+        save_results(results, mode)
+    compare_k_values(embeddings, parse_k(args.k), mode, args.n_init, args.workers, on_result=record)
     print_report(results)
+    print(f"💾 Saved: {SWEEP_JSON}")
 
 if __name__ == "__main__":
     main()
-
-
-
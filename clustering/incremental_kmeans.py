@@ -0,0 +1,78 @@
+import json, sys # Incremental re-clustering: warm-start from the last centers, mini-batch update on new points only, full refit on drift
+import numpy as np
+sys.path.insert(0, str(__file__).rsplit("/", 2)[0])
+from embedding.config_embed import DEFAULT_K, CLUSTERS_JSON, MINIBATCH_SIZE, RECLUSTER_DRIFT, RECLUSTER_MAX_NEW_FRACTION
+from clustering.cluster_artifact import artifact_exists, load_cluster_artifact
+from clustering.kmeans_cluster import load_embeddings, nearest_center, extract_representatives, save_clusters, update_db_clusters, run_clustering
+
+def load_warm_start() -> tuple[np.ndarray, np.ndarray, np.ndarray, dict[str, int], dict]:  # (cluster_ids, centers, sizes, content_hash → cluster_id, meta)
+    if artifact_exists():
+        a = load_cluster_artifact()  # Fit sizes and labels only: points in the assigned delta were never folded into the centers, so they count as new
+        return np.array(a.cluster_ids), np.array(a.centers, dtype=np.float32), np.array(a.base_sizes, dtype=np.float64), a.label_map(include_assigned=False), a.meta
+    if not CLUSTERS_JSON.exists(): raise FileNotFoundError("No previous clusters to warm-start from (run clustering.kmeans_cluster)")
+    with open(CLUSTERS_JSON) as f: clusters = json.load(f)  # Legacy export: centers + sizes, no per-point labels
+    ids = np.array([c["cluster_id"] for c in clusters], dtype=np.int32)
+    return ids, np.array([c["center_embedding"] for c in clusters], dtype=np.float32), np.array([c["size"] for c in clusters], dtype=np.float64), {}, {}
+
+def minibatch_update(centers: np.ndarray, counts: np.ndarray, x: np.ndarray, batch_size: int = MINIBATCH_SIZE, seed: int = 42) -> tuple[np.ndarray, np.ndarray]:
+    """Streaming k-means: each center is the running mean of every point it has absorbed. counts start at the previous cluster sizes,
+    so a handful of new points nudges a big cluster only slightly (per-center learning rate 1 / count)."""
+    centers, counts = centers.copy(), counts.copy()
+    order = np.random.default_rng(seed).permutation(len(x))
+    for i in range(0, len(order), batch_size):
+        xb = np.asarray(x[np.sort(order[i:i + batch_size])], dtype=np.float32)
+        rows, _ = nearest_center(xb, centers)
+        onehot = np.zeros((len(xb), len(centers)), dtype=np.float32)
+        onehot[np.arange(len(xb)), rows] = 1
+        n = onehot.sum(axis=0)
+        counts += n
+        hit = n > 0
+        centers[hit] += (onehot.T[hit] @ xb - n[hit, None] * centers[hit]) / counts[hit, None]
+    return centers, counts
+
+def run_incremental(update_db: bool = True, sync: bool = True, drift_threshold: float = RECLUSTER_DRIFT, max_new_fraction: float = RECLUSTER_MAX_NEW_FRACTION, force_full: bool = False) -> list[dict]:
+    hashes, embeddings, data = load_embeddings(sync=sync)
+    ids, centers, counts, label_map, meta = load_warm_start()
+    stored = [d.get("cluster_id") for d in data]  # What Supabase holds (write-back diff; warm-start labels for legacy clusters.json)
+    known = label_map or dict(zip(hashes, stored))
+    prev = np.array([-1 if known.get(h) is None else known[h] for h in hashes], dtype=np.int64)
+    new_idx = np.flatnonzero(~np.isin(prev, ids))
+    full_fit_points = meta.get("full_fit_points") or int(len(hashes) - len(new_idx))
+    added = meta.get("added_since_full", 0) + len(new_idx)
+    print(f"🧩 Warm start: {len(ids)} centers, {len(hashes) - len(new_idx)} labeled, {len(new_idx)} new ({added} since last full fit of {full_fit_points})")
+    if force_full or not full_fit_points or added / full_fit_points > max_new_fraction:
+        print("   ↪ Full refit (forced, or too much new data since the last one)")
+        return run_clustering(k=len(ids) or DEFAULT_K, update_db=update_db, sync=False)
+    baseline = meta.get("baseline_inertia")
+    if baseline is None:  # Legacy warm start: baseline is how well the old centers fit the points they were fit on
+        labeled = np.flatnonzero(np.isin(prev, ids))
+        baseline = float(nearest_center(embeddings[labeled], centers)[1].mean())
+
+    if len(new_idx): centers, counts = minibatch_update(centers, counts, embeddings[new_idx])
+    rows, d2 = nearest_center(embeddings, centers)  # Single vectorized pass: new points get labels, old ones follow moved centers
+    drift = float(d2.mean()) / baseline - 1
+    print(f"   Mean sq. distance {d2.mean():.4f} vs {baseline:.4f} at last full fit (drift {drift:+.1%}, threshold {drift_threshold:.0%})")
+    if drift > drift_threshold:
+        print("   ↪ Drift above threshold: refitting")
+        return run_clustering(k=len(ids), update_db=update_db, sync=False)
+
+    labels = ids[rows]
+    full_centers = np.zeros((int(ids.max()) + 1, centers.shape[1]), dtype=np.float32)  # Indexed by cluster_id for extract_representatives / the artifact
+    full_centers[ids] = centers
+    clusters = extract_representatives(hashes, embeddings, labels, full_centers, data)
+    save_clusters(clusters, full_centers, hashes, labels, extra_meta={"fit": "incremental", "baseline_inertia": baseline, "full_fit_points": full_fit_points, "added_since_full": added, "drift": drift})
+    if update_db: update_db_clusters(hashes, labels, stored)
+    return clusters
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description="Incremental K-means: mini-batch update from the previous centers, full refit on drift")
+    parser.add_argument("--no-db-update", action="store_true", help="Skip updating cluster_id in Supabase")
+    parser.add_argument("--no-sync", action="store_true", help="Use local embedding store as-is (skip Supabase sync)")
+    parser.add_argument("--drift", type=float, default=RECLUSTER_DRIFT, help="Relative inertia increase that triggers a full refit")
+    parser.add_argument("--full", action="store_true", help="Force a full refit")
+    args = parser.parse_args()
+    run_incremental(update_db=not args.no_db_update, sync=not args.no_sync, drift_threshold=args.drift, force_full=args.full)
+
+if __name__ == "__main__":
+    main()
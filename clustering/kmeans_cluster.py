@@ -2,22 +2,18 @@ import json, sys # K-means clustering with representatives extraction
 import numpy as np
 from sklearn.cluster import KMeans
 from sklearn.metrics import silhouette_score
-from tqdm import tqdm
 sys.path.insert(0, str(__file__).rsplit("/", 2)[0])
 from embedding.config_embed import DEFAULT_K, K_CANDIDATES, CLUSTER_REPRESENTATIVES, CLUSTERS_JSON
-from vector_db.supabase_client import get_all_embeddings, batch_update_clusters
+from vector_db.bulk_upsert import bulk_update_clusters
+from vector_db.local_store import LocalEmbeddingStore
+from clustering.cluster_artifact import save_cluster_artifact
 
-def load_embeddings() -> tuple[list[str], np.ndarray, list[dict]]:  # Fetch embeddings from Supabase
-    import json
-    print("📂 Loading embeddings from Supabase...")
-    data = get_all_embeddings()
-    if not data: raise ValueError("No embeddings found in database")
-    hashes = [d["content_hash"] for d in data]
-    emb_list = []
-    for d in data:  # Handle string or list embeddings
-        emb = d["embedding"]
-        emb_list.append(json.loads(emb) if isinstance(emb, str) else emb)
-    embeddings = np.array(emb_list, dtype=np.float32)
+def load_embeddings(sync: bool = True) -> tuple[list[str], np.ndarray, list[dict]]:  # Read embeddings zero-copy from the local memmap store (incremental Supabase sync first)
+    store = LocalEmbeddingStore()
+    if sync or not store.exists(): store.sync()
+    print("📂 Loading embeddings from local store...")
+    hashes, embeddings, data = store.hashes(), store.embeddings(), store.rows()
+    if not hashes: raise ValueError("No embeddings found in database")
     print(f"   Loaded {len(hashes)} embeddings, dim={embeddings.shape[1]}")
     return hashes, embeddings, data
 
@@ -29,42 +25,62 @@ def run_kmeans(embeddings: np.ndarray, k: int = DEFAULT_K) -> tuple[np.ndarray,
     print(f"   Inertia: {kmeans.inertia_:.2f}")
     return labels, centers
 
-def extract_representatives(hashes: list[str], embeddings: np.ndarray, labels: np.ndarray, centers: np.ndarray, data: list[dict], n: int = CLUSTER_REPRESENTATIVES) -> list[dict]:  # Extract top-N representatives per cluster
+def nearest_center(x: np.ndarray, centers: np.ndarray, block: int = 65536) -> tuple[np.ndarray, np.ndarray]:  # (row of nearest center, squared distance) via ||x||² - 2x·c + ||c||², one matmul per block
+    centers = np.asarray(centers, dtype=np.float32)
+    c_sq = np.einsum("ij,ij->i", centers, centers)
+    rows, d2 = np.empty(len(x), dtype=np.int64), np.empty(len(x), dtype=np.float32)
+    for i in range(0, len(x), block):
+        xb = np.asarray(x[i:i + block], dtype=np.float32)
+        scores = xb @ centers.T * -2 + c_sq
+        rows[i:i + block] = scores.argmin(axis=1)
+        d2[i:i + block] = np.maximum(scores[np.arange(len(xb)), rows[i:i + block]] + np.einsum("ij,ij->i", xb, xb), 0)
+    return rows, d2
+
+def extract_representatives(hashes: list[str], embeddings: np.ndarray, labels: np.ndarray, centers: np.ndarray, data: list[dict], n: int = CLUSTER_REPRESENTATIVES, block: int = 65536) -> list[dict]:  # Extract top-N representatives per cluster
     print(f"📌 Extracting {n} representatives per cluster...")
+    labels, centers = np.asarray(labels), np.asarray(centers)
+    dists = np.empty(len(labels), dtype=np.float32)
+    for i in range(0, len(labels), block):  # Distance to own center, blockwise (never materializes an N x D difference)
+        dists[i:i + block] = np.linalg.norm(np.asarray(embeddings[i:i + block], dtype=np.float32) - centers[labels[i:i + block]], axis=1)
+    order = np.argsort(labels, kind="stable")  # Group points by cluster once
+    sizes = np.bincount(labels, minlength=len(centers))
+    ends = np.cumsum(sizes)
     clusters = []
-    unique_labels = sorted(set(labels))
-    
-    for cluster_id in tqdm(unique_labels, desc="Clusters"):
-        mask = labels == cluster_id
-        cluster_hashes = np.array(hashes)[mask]
-        cluster_embs = embeddings[mask]
-        cluster_data = [d for d, m in zip(data, mask) if m]
-        
-        dists = np.linalg.norm(cluster_embs - centers[cluster_id], axis=1)  # Distance to center
-        top_indices = np.argsort(dists)[:n]
-        
-        reps = [{"content_hash": cluster_hashes[i], "image_url": cluster_data[i]["image_url"], "category": cluster_data[i]["category"], "distance": float(dists[i])} for i in top_indices]
-        clusters.append({"cluster_id": int(cluster_id), "size": int(mask.sum()), "center_embedding": centers[cluster_id].tolist(), "representatives": reps})
-    
+    for cluster_id in np.flatnonzero(sizes):
+        members = order[ends[cluster_id] - sizes[cluster_id]:ends[cluster_id]]
+        d = dists[members]
+        top = np.argpartition(d, n - 1)[:n] if len(d) > n else np.arange(len(d))
+        top = members[top[np.argsort(d[top])]]
+        reps = [{"content_hash": hashes[i], "image_url": data[i]["image_url"], "category": data[i]["category"], "distance": float(dists[i])} for i in top.tolist()]
+        clusters.append({"cluster_id": int(cluster_id), "size": int(sizes[cluster_id]), "center_embedding": centers[cluster_id].tolist(), "representatives": reps})
     return clusters
 
-def save_clusters(clusters: list[dict], path=CLUSTERS_JSON):  # Save clusters to JSON
+def save_clusters(clusters: list[dict], centers: np.ndarray, hashes: list[str] = None, labels: np.ndarray = None, write_json: bool = False, path=CLUSTERS_JSON, extra_meta: dict = None):  # Save binary artifact (+ optional legacy JSON)
+    root = save_cluster_artifact(clusters, centers, labels, hashes, extra_meta)
+    print(f"💾 Saved {len(clusters)} clusters to {root}")
+    if not write_json: return
     path.parent.mkdir(parents=True, exist_ok=True)
-    with open(path, "w") as f: json.dump(clusters, f, indent=2)
+    tmp = path.with_suffix(".tmp.json")  # tmp + rename so readers never see a partial file
+    with open(tmp, "w") as f: json.dump(clusters, f, indent=2)
+    tmp.replace(path)
     print(f"💾 Saved {len(clusters)} clusters to {path}")
 
-def update_db_clusters(hashes: list[str], labels: np.ndarray):  # Update cluster_id in Supabase
-    print("📤 Updating cluster IDs in Supabase...")
+def update_db_clusters(hashes: list[str], labels: np.ndarray, previous: list | None = None):  # Bulk cluster_id write-back; only rows whose label changed vs previous (local store's last known value)
     updates = list(zip(hashes, labels.tolist()))
-    success = batch_update_clusters(updates)
+    if previous is not None: updates = [(h, c) for (h, c), p in zip(updates, previous) if p != c]
+    print(f"📤 Updating cluster IDs in Supabase ({len(updates)}/{len(hashes)} changed)...")
+    success = bulk_update_clusters(updates)
     print(f"   Updated {success}/{len(updates)} records")
+    if success == len(updates): LocalEmbeddingStore().set_attribute("cluster_id", dict(updates))  # Next run diffs against what Supabase now holds
 
-def run_clustering(k: int = DEFAULT_K, update_db: bool = True) -> list[dict]:  # Full clustering pipeline
-    hashes, embeddings, data = load_embeddings()
+def run_clustering(k: int = DEFAULT_K, update_db: bool = True, sync: bool = True, write_json: bool = False) -> list[dict]:  # Full clustering pipeline
+    hashes, embeddings, data = load_embeddings(sync=sync)
     labels, centers = run_kmeans(embeddings, k)
     clusters = extract_representatives(hashes, embeddings, labels, centers, data)
-    save_clusters(clusters)
-    if update_db: update_db_clusters(hashes, labels)
+    _, d2 = nearest_center(embeddings, centers)
+    fit = {"fit": "full", "baseline_inertia": float(d2.mean()), "full_fit_points": len(hashes)}  # Drift reference for clustering.incremental_kmeans
+    save_clusters(clusters, centers, hashes, labels, write_json=write_json, extra_meta=fit)
+    if update_db: update_db_clusters(hashes, labels, [d.get("cluster_id") for d in data])
     return clusters
 
 def main():
@@ -72,8 +88,10 @@ def main():
     parser = argparse.ArgumentParser(description="K-means clustering")
     parser.add_argument("--k", type=int, default=DEFAULT_K, help=f"Number of clusters (default: {DEFAULT_K})")
     parser.add_argument("--no-db-update", action="store_true", help="Skip updating cluster_id in Supabase")
+    parser.add_argument("--no-sync", action="store_true", help="Use local embedding store as-is (skip Supabase sync)")
+    parser.add_argument("--json", action="store_true", help="Also write legacy clusters.json")
     args = parser.parse_args()
-    run_clustering(k=args.k, update_db=not args.no_db_update)
+    run_clustering(k=args.k, update_db=not args.no_db_update, sync=not args.no_sync, write_json=args.json)
 
 if __name__ == "__main__":
     main()
@@ -1,12 +1,13 @@
-import json, sys # Quick visualization using cluster data (no Supabase fetch needed)
+import sys # Quick visualization using cluster data (no Supabase fetch needed)
 import numpy as np
 import matplotlib.pyplot as plt
 from pathlib import Path
 sys.path.insert(0, str(__file__).rsplit("/", 2)[0])
-from embedding.config_embed import CLUSTERS_JSON, UMAP_OUTPUT_DIR
+from embedding.config_embed import UMAP_OUTPUT_DIR
+from clustering.cluster_artifact import load_cluster_dicts
 
-def load_cluster_data():  # Load clusters.json
-    with open(CLUSTERS_JSON) as f: return json.load(f)
+def load_cluster_data():  # Load cluster artifact (centers as memmap rows) or legacy clusters.json
+    return load_cluster_dicts(include_center=True)
 
 def plot_cluster_summary(clusters: list[dict], output_dir: Path):  # Bar chart of cluster sizes
     output_dir.mkdir(parents=True, exist_ok=True)
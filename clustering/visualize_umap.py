@@ -5,6 +5,7 @@ import matplotlib.pyplot as plt
 from pathlib import Path
 sys.path.insert(0, str(__file__).rsplit("/", 2)[0])
 from embedding.config_embed import UMAP_OUTPUT_DIR, CLUSTERS_JSON
+from clustering.cluster_artifact import artifact_exists, load_cluster_artifact
 from clustering.kmeans_cluster import load_embeddings
 
 def run_umap(embeddings: np.ndarray, n_components: int = 2, n_neighbors: int = 15, min_dist: float = 0.1) -> np.ndarray:  # Reduce embeddings to 2D/3D
@@ -57,17 +58,16 @@ def plot_by_category(coords: np.ndarray, data: list[dict], output_path: Path, to
     plt.close()
     print(f"   💾 Saved: {output_path}")
 
-def plot_by_cluster(coords: np.ndarray, data: list[dict], output_path: Path):  # Color by cluster_id (requires clusters.json)
-    if not CLUSTERS_JSON.exists():
-        print("   ⚠️ clusters.json not found, skipping cluster plot")
+def plot_by_cluster(coords: np.ndarray, data: list[dict], output_path: Path):  # Color by cluster_id (requires cluster artifact or clusters.json)
+    if artifact_exists():
+        hash_to_cluster = load_cluster_artifact().label_map()  # Labels for every point, not just representatives
+    elif CLUSTERS_JSON.exists():
+        with open(CLUSTERS_JSON) as f: clusters = json.load(f)
+        hash_to_cluster = {rep["content_hash"]: c["cluster_id"] for c in clusters for rep in c.get("representatives", [])}
+    else:
+        print("   ⚠️ No cluster artifact found, skipping cluster plot")
         return
     
-    with open(CLUSTERS_JSON) as f: clusters = json.load(f)
-    hash_to_cluster = {}
-    for c in clusters:
-        for rep in c.get("representatives", []):
-            hash_to_cluster[rep["content_hash"]] = c["cluster_id"]
-    
     cluster_ids = [hash_to_cluster.get(d["content_hash"], -1) for d in data]
     n_clusters = max(cluster_ids) + 1
     
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""Accuracy vs throughput of each INFERENCE_BACKEND against fp32 on a sample of master CSV images"""
+import asyncio, json, sys, time
+from itertools import islice
+import aiohttp
+import numpy as np
+import torch
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from embedding.config_embed import MASTER_CSV, OUTPUT_DIR, IMAGE_SIZE, DOWNLOAD_TIMEOUT, MAX_CONCURRENT_DOWNLOADS, BATCH_SIZE
+from embedding.csv_stream import iter_csv_rows
+from embedding.preprocess_pool import decode_to_array, CLIP_MEAN, CLIP_STD
+from embedding.inference_backend import BACKENDS, load_clip
+
+QUERIES = ["minimal luxury product shot", "warm cozy cafe interior", "bold colorful sneaker ad", "dark moody perfume bottle", "pastel skincare flat lay", "surreal floating watch",
+           "retro typography poster", "clean saas landing page", "neon cyberpunk city", "organic food packaging", "black and white portrait", "flat vector illustration"]
+TOP_K = 10
+
+async def _fetch_sample(n: int) -> np.ndarray:  # (n, 3, S, S) normalized pixels from the first n decodable CSV rows
+    urls = [row["url"] for row, _ in islice(iter_csv_rows(MASTER_CSV), n * 2)]  # 2x headroom for dead links
+    sem = asyncio.Semaphore(MAX_CONCURRENT_DOWNLOADS)
+    async def get(session, url):
+        async with sem:
+            try:
+                async with session.get(url, timeout=aiohttp.ClientTimeout(total=DOWNLOAD_TIMEOUT)) as resp:
+                    return decode_to_array(await resp.read(), IMAGE_SIZE) if resp.status == 200 else None
+            except Exception: return None
+    async with aiohttp.ClientSession(headers={"User-Agent": "Mozilla/5.0"}) as session:
+        arrays = [a for a in await asyncio.gather(*[get(session, u) for u in urls]) if a is not None][:n]
+    x = np.stack(arrays).transpose(0, 3, 1, 2).astype(np.float32) / 255
+    return (x - np.array(CLIP_MEAN, np.float32).reshape(1, 3, 1, 1)) / np.array(CLIP_STD, np.float32).reshape(1, 3, 1, 1)
+
+def _unit(x: torch.Tensor) -> np.ndarray:
+    x = x.float().cpu().numpy()
+    return x / np.linalg.norm(x, axis=1, keepdims=True)
+
+def _encode(model, tokenizer, pixels: np.ndarray) -> tuple[np.ndarray, np.ndarray, float, float]:  # (image embs, text embs, images/s, queries/s)
+    batches = [torch.from_numpy(pixels[i:i + BATCH_SIZE]) for i in range(0, len(pixels), BATCH_SIZE)]
+    tokens = tokenizer(QUERIES)
+    model.encode_image(batches[0][:2]); model.encode_text(tokens[:2])  # Warmup (compile / ORT graph init)
+    t0 = time.perf_counter()
+    img = np.concatenate([_unit(model.encode_image(b)) for b in batches])
+    img_rate = len(pixels) / (time.perf_counter() - t0)
+    t0 = time.perf_counter()
+    txt = _unit(model.encode_text(tokens))
+    return img, txt, img_rate, len(QUERIES) / (time.perf_counter() - t0)
+
+def _topk_overlap(q: np.ndarray, db: np.ndarray, q_ref: np.ndarray, db_ref: np.ndarray) -> float:  # Mean |top-k ∩ fp32 top-k| / k
+    k = min(TOP_K, len(db))
+    top = np.argsort(-(q @ db.T), axis=1)[:, :k]
+    ref = np.argsort(-(q_ref @ db_ref.T), axis=1)[:, :k]
+    return float(np.mean([len(set(a) & set(b)) / k for a, b in zip(top, ref)]))
+
+def run_report(backends: list[str], n_images: int) -> list[dict]:
+    pixels = asyncio.run(_fetch_sample(n_images))
+    print(f"🖼️ {len(pixels)} sample images, {len(QUERIES)} text queries")
+    results, ref = [], None
+    for backend in ["fp32"] + [b for b in backends if b != "fp32"]:  # fp32 first: it is the reference
+        t0 = time.perf_counter()
+        try: model, _, tokenizer = load_clip(backend)
+        except Exception as e:
+            print(f"⚠️ {backend}: {e}")
+            continue
+        load_s = time.perf_counter() - t0
+        img, txt, img_rate, txt_rate = _encode(model, tokenizer, pixels)
+        if ref is None: ref = (img, txt)
+        r = {"backend": backend, "device": model.device, "load_s": round(load_s, 1), "images_per_s": round(img_rate, 1), "queries_per_s": round(txt_rate, 1),
+             "image_cos_mean": round(float(np.sum(img * ref[0], axis=1).mean()), 5), "image_cos_min": round(float(np.sum(img * ref[0], axis=1).min()), 5),
+             "text_cos_mean": round(float(np.sum(txt * ref[1], axis=1).mean()), 5),
+             "image_recall@10": round(_topk_overlap(img, img, ref[0], ref[0]), 4), "text_recall@10": round(_topk_overlap(txt, img, ref[1], ref[0]), 4)}
+        r["speedup"] = round(r["images_per_s"] / results[0]["images_per_s"], 2) if results else 1.0
+        results.append(r)
+        print(f"{r['backend']:>8} {r['device']:>5} {r['images_per_s']:>8} img/s  x{r['speedup']:<5} cos {r['image_cos_mean']:.4f} (min {r['image_cos_min']:.4f})  text cos {r['text_cos_mean']:.4f}  R@10 img {r['image_recall@10']:.3f} txt {r['text_recall@10']:.3f}")
+        del model
+    return results
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description="Benchmark CLIP inference backends vs fp32")
+    parser.add_argument("--backends", default=",".join(BACKENDS), help="Comma-separated subset of " + ",".join(BACKENDS))
+    parser.add_argument("--images", type=int, default=256, help="Sample size from the master CSV")
+    args = parser.parse_args()
+    results = run_report(args.backends.split(","), args.images)
+    out = OUTPUT_DIR / "bench_backends.json"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    with open(out, "w") as f: json.dump(results, f, indent=2)
+    print(f"💾 Saved: {out}")
+
+if __name__ == "__main__":
+    main()
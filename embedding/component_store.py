@@ -0,0 +1,63 @@
+import os, sys, time, threading # Append-only shards of pre-fusion embedding components (image/text tower outputs + text flags), keyed by content_hash
+import numpy as np
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from settings import COMPONENT_STORE_DIR, EMBED_DIM
+
+FLUSH_ROWS = 4096  # Rows buffered before a shard is written
+VECTOR_DTYPE = np.float16  # Unit-norm tower outputs: float16 keeps ~3 decimal digits per dim at half the bytes (cos error ~1e-4)
+TEXT_TITLE, TEXT_ALT = 1, 2  # flags bits: which text fields fed the text tower (get_text_weight inputs)
+
+class ComponentStore:
+    """Each shard is <id>.<component>.npy (row-aligned; 2-D vectors stored as float16) plus <id>.hashes.npy, written last as the shard's commit point.
+    Readers only see shards whose hashes file exists; a crash mid-flush leaves an orphan component file that is ignored."""
+    def __init__(self, root: Path = COMPONENT_STORE_DIR, flush_rows: int = FLUSH_ROWS):
+        self.root, self.flush_rows = Path(root), flush_rows
+        self._buf_hashes: list[str] = []
+        self._buf: dict[str, list[np.ndarray]] = {}
+        self._lock = threading.Lock()
+
+    def append(self, hashes: list[str], **components: np.ndarray):  # e.g. append(hashes, image=img_embs, text=txt_embs, flags=flags)
+        with self._lock:
+            self._buf_hashes.extend(hashes)
+            for name, arr in components.items():
+                arr = np.asarray(arr)
+                self._buf.setdefault(name, []).append(arr.astype(VECTOR_DTYPE) if arr.ndim == 2 else arr)
+            if len(self._buf_hashes) >= self.flush_rows: self._flush()
+
+    def flush(self):
+        with self._lock: self._flush()
+
+    def _flush(self):
+        if not self._buf_hashes: return
+        self.root.mkdir(parents=True, exist_ok=True)
+        shard = f"{time.strftime('%Y%m%d%H%M%S')}-{time.time_ns() % 10**9:09d}"
+        for name, parts in self._buf.items(): self._save(f"{shard}.{name}.npy", np.concatenate(parts))
+        self._save(f"{shard}.hashes.npy", np.asarray(self._buf_hashes, dtype=str))  # Commit
+        self._buf_hashes, self._buf = [], {}
+
+    def _save(self, name: str, arr: np.ndarray):
+        tmp = self.root / f"{name}.tmp"
+        with open(tmp, "wb") as f: np.save(f, arr)
+        os.replace(tmp, self.root / name)
+
+    def shards(self) -> list[str]:  # Committed shard ids, oldest first
+        if not self.root.exists(): return []
+        return sorted(p.name[:-len(".hashes.npy")] for p in self.root.glob("*.hashes.npy"))
+
+    def load(self, component: str = "image") -> tuple[list[str], np.ndarray]:  # (hashes, (N, D) as stored); a re-embedded hash keeps its newest row
+        hashes, arrays = self.load_many([component])
+        return hashes, arrays[component]
+
+    def load_many(self, components: list[str]) -> tuple[list[str], dict[str, np.ndarray]]:  # Row-aligned components from shards that recorded all of them
+        hashes, blocks = [], {c: [] for c in components}
+        for shard in self.shards():
+            paths = {c: self.root / f"{shard}.{c}.npy" for c in components}
+            if not all(p.exists() for p in paths.values()): continue  # Shard written before a component was recorded
+            hashes.extend(np.load(self.root / f"{shard}.hashes.npy").tolist())
+            for c, p in paths.items(): blocks[c].append(np.load(p, mmap_mode="r"))
+        if not hashes: return [], {c: np.empty((0, EMBED_DIM), dtype=VECTOR_DTYPE) for c in components}
+        latest = {h: i for i, h in enumerate(hashes)}
+        if len(latest) == len(hashes): return hashes, {c: np.concatenate(b) for c, b in blocks.items()}
+        keep = np.fromiter(sorted(latest.values()), dtype=np.int64)
+        return [hashes[i] for i in keep], {c: np.concatenate(b)[keep] for c, b in blocks.items()}
@@ -5,10 +5,12 @@ from pathlib import Path
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
 from settings import (  # Re-export from unified settings
-    PROJECT_ROOT, OUTPUT_DIR, MASTER_CSV, CLUSTERS_JSON, VISUALIZATIONS_DIR,
-    CLIP_MODEL as MODEL_NAME, CLIP_PRETRAINED as PRETRAINED, EMBED_DIM,
+    PROJECT_ROOT, OUTPUT_DIR, MASTER_CSV, CLUSTERS_JSON, CLUSTERS_ARTIFACT, VISUALIZATIONS_DIR, EMBEDDING_STORE_DIR,
+    CLIP_MODEL as MODEL_NAME, CLIP_PRETRAINED as PRETRAINED, EMBED_DIM, INFERENCE_BACKEND,
     EMBED_BATCH_SIZE as BATCH_SIZE, MAX_CONCURRENT_DOWNLOADS, DOWNLOAD_TIMEOUT,
-    get_text_weight, DEFAULT_K, K_CANDIDATES, CLUSTER_REPRESENTATIVES, SUPABASE_TABLE
+    EMBED_DECODE_WORKERS, EMBED_UPLOAD_WORKERS, EMBED_QUEUE_BATCHES, EMBED_CHECKPOINT, EMBED_LEDGER,
+    get_text_weight, DEFAULT_K, K_CANDIDATES, CLUSTER_REPRESENTATIVES, SUPABASE_TABLE, BULK_UPSERT_CHUNK,
+    MINIBATCH_SIZE, RECLUSTER_DRIFT, RECLUSTER_MAX_NEW_FRACTION, SWEEP_WORKERS, SILHOUETTE_SAMPLE, ASSIGN_FLUSH_ROWS
 )
 
 # Backwards compatibility
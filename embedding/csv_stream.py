@@ -0,0 +1,95 @@
+import csv, hashlib, json, os # Streaming master CSV reader with byte-offset checkpoints (O(1) resume while the file is only appended to)
+from pathlib import Path
+from collections import deque
+from itertools import takewhile
+from typing import Iterator
+
+FINGERPRINT_BYTES = 4096  # Data hashed just before a saved offset (plus the header) to tell an appended file from a rewritten one
+
+def _read_record(f) -> tuple[bytes, int] | None:  # One CSV record (quoted fields may span lines) + byte offset just past it
+    line = f.readline()
+    if not line: return None
+    while line.count(b'"') % 2 and (more := f.readline()): line += more  # Odd quote count → record continues ("" escapes stay even)
+    return line, f.tell()
+
+def iter_csv_rows(path: Path, start: int = 0) -> Iterator[tuple[dict, int]]:
+    """Yield (row, end_offset) from byte `start` (0 = first data row). end_offset is a valid resume point for the next call."""
+    with open(path, "rb") as f:
+        header = _read_record(f)
+        if header is None: return
+        fields = next(csv.reader([header[0].decode("utf-8-sig")]))
+        if start > header[1]: f.seek(start)
+        while (rec := _read_record(f)) is not None:
+            values = next(csv.reader([rec[0].decode("utf-8", errors="replace")]), None)
+            if values: yield dict(zip(fields, values)), rec[1]
+
+def iter_batches(path: Path, batch_size: int, start: int = 0, limit: int = None, skip: set[str] = None) -> Iterator[list[tuple[dict, int]]]:
+    """Batches of (row, end_offset), dropping rows whose content_hash is in `skip`. `limit` means the first N rows of the file:
+    rows before `start` (a resume) and skipped rows count toward it, so a resumed --limit run finishes the same slice"""
+    n = sum(1 for _ in takewhile(lambda r: r[1] <= start, iter_csv_rows(path))) if limit and start else 0  # Prefix scan only with a limit
+    batch = []
+    for row, end in iter_csv_rows(path, start):
+        if limit and n >= limit: break
+        n += 1
+        if skip and row.get("content_hash") in skip: continue
+        batch.append((row, end))
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch: yield batch
+
+def fingerprint(path: Path, offset: int) -> str:  # Header record + the bytes ending at offset; changes if anything up to the offset was rewritten
+    with open(path, "rb") as f:
+        header = _read_record(f)
+        digest = hashlib.sha1(header[0] if header else b"")
+        lo = max(header[1] if header else 0, offset - FINGERPRINT_BYTES)
+        if offset > lo:
+            f.seek(lo)
+            digest.update(f.read(offset - lo))
+    return digest.hexdigest()
+
+class CsvCheckpoint:
+    """Low-watermark byte offset: advances only past rows whose every predecessor is finished, so out-of-order
+    pipeline completion never skips a row on resume. Finished = uploaded or permanently failed (dead URL, undecodable image);
+    rows lost to transient errors (model, Supabase) are never marked done, so the watermark holds at the first of them and the next run retries it.
+    The offset is saved with a fingerprint of the bytes before it: a file rewritten in place (merge_sources' to_csv) restarts from 0."""
+    def __init__(self, path: Path, csv_path: Path):
+        self.path, self.csv_path = Path(path), Path(csv_path)
+        self.offset, self._pending, self._done, self._next = 0, deque(), set(), 0
+
+    def load(self) -> int:  # Stored offset, or 0 if missing / written for another file / file was truncated or rewritten
+        if not self.path.exists(): return 0
+        try:
+            with open(self.path) as f: state = json.load(f)
+        except (OSError, ValueError): return 0
+        offset = state.get("offset", 0)
+        if state.get("csv") != str(self.csv_path) or not offset: return 0
+        if offset > os.path.getsize(self.csv_path) or state.get("fingerprint") != fingerprint(self.csv_path, offset):
+            print(f"⚠️ {self.csv_path.name} was rewritten since the checkpoint (byte {offset:,}): restarting from the top")
+            return 0
+        self.offset = offset
+        return self.offset
+
+    def track(self, end_offset: int) -> int:  # Register a row in feed order → ticket for done()
+        self._pending.append(end_offset)
+        return self._next + len(self._pending) - 1
+
+    def done(self, ticket: int):
+        self._done.add(ticket)
+        while self._pending and self._next in self._done:  # Pop the finished prefix
+            self._done.discard(self._next)
+            self.offset = self._pending.popleft()
+            self._next += 1
+
+    def pending(self) -> int:  # Tracked rows the watermark can't pass yet (in flight, or failed transiently)
+        return len(self._pending)
+
+    def save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(".tmp.json")
+        with open(tmp, "w") as f: json.dump({"csv": str(self.csv_path), "offset": self.offset, "fingerprint": fingerprint(self.csv_path, self.offset)}, f)
+        os.replace(tmp, self.path)
+
+    def reset(self):
+        self.offset = 0
+        self.path.unlink(missing_ok=True)
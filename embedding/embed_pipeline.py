@@ -1,20 +1,32 @@
-import asyncio, aiohttp, csv, io, sys, time # Streaming embedding pipeline: download → embed → upload → delete
+import asyncio, aiohttp, sys, threading, time # Streaming embedding pipeline: download → decode → embed → upload (concurrent stages)
 from PIL import Image
 import torch
-import open_clip
 import numpy as np
 from tqdm import tqdm
+from concurrent.futures import ThreadPoolExecutor
 sys.path.insert(0, str(__file__).rsplit("/", 2)[0])
 from embedding.config_embed import *
-from vector_db.supabase_client import upsert_batch
+from embedding.preprocess_pool import PreprocessPool, CLIP_MEAN, CLIP_STD
+from embedding.csv_stream import CsvCheckpoint, iter_batches
+from embedding.hash_ledger import HashLedger
+from embedding.inference_backend import load_clip, BACKENDS
+from embedding.image_cache import get_image_cache
+from embedding.component_store import ComponentStore, TEXT_TITLE, TEXT_ALT
+from vector_db.bulk_upsert import bulk_upsert
+
+class _RowsCheckpoint:  # Rows handed in directly (process_batch_streaming) have no CSV offset to checkpoint
+    def track(self, end_offset: int) -> int: return 0
+    def done(self, ticket: int): pass
+    def pending(self) -> int: return 0
+    def save(self): pass
 
 class EmbeddingPipeline:
-    def __init__(self):
-        self.device = "mps" if torch.backends.mps.is_available() else "cpu"  # M3 Max Metal
-        print(f"🖥️ Using device: {self.device}")
-        self.model, _, self.preprocess = open_clip.create_model_and_transforms(MODEL_NAME, pretrained=PRETRAINED)
-        self.model = self.model.to(self.device).eval()
-        self.tokenizer = open_clip.get_tokenizer(MODEL_NAME)
+    def __init__(self, backend: str = INFERENCE_BACKEND, assign_clusters: bool = False):
+        self.model, self.preprocess, self.tokenizer = load_clip(backend)
+        self.device = self.model.device
+        self.components = ComponentStore()
+        self.assign_clusters, self.assigner = assign_clusters, None  # Assigner set: every record is uploaded with its nearest-center cluster_id
+        print(f"🖥️ Using device: {self.device} ({backend})")
         print(f"✅ Loaded {MODEL_NAME}/{PRETRAINED}")
 
     def _build_text(self, row: dict) -> str:  # Combine text fields
@@ -22,97 +34,221 @@ class EmbeddingPipeline:
         return " | ".join(p for p in parts if p)
 
     @torch.no_grad()
-    def _embed_batch(self, images: list[Image.Image], texts: list[str], weights: list[float]) -> np.ndarray:  # Batch embed images + texts with dynamic fusion
-        img_tensors = torch.stack([self.preprocess(img) for img in images]).to(self.device)
-        img_embs = self.model.encode_image(img_tensors).float().cpu().numpy()
+    def _encode(self, img_tensors: torch.Tensor, texts: list[str]) -> tuple[np.ndarray, np.ndarray]:  # Unit-norm (image, text) tower outputs
+        img_embs = self.model.encode_image(img_tensors).cpu().numpy()
         img_embs = img_embs / np.linalg.norm(img_embs, axis=1, keepdims=True)
         
-        text_tokens = self.tokenizer(texts).to(self.device)
-        txt_embs = self.model.encode_text(text_tokens).float().cpu().numpy()
+        txt_embs = self.model.encode_text(self.tokenizer(texts)).cpu().numpy()
         txt_embs = txt_embs / np.linalg.norm(txt_embs, axis=1, keepdims=True)
-        
+        return img_embs, txt_embs
+
+    @staticmethod
+    def _fuse(img_embs: np.ndarray, txt_embs: np.ndarray, weights: list[float]) -> np.ndarray:  # Dynamic fusion
         weights = np.array(weights).reshape(-1, 1)
         fused = (1.0 * img_embs + weights * txt_embs)
         return fused / np.linalg.norm(fused, axis=1, keepdims=True)  # L2 normalize
 
-    async def _download_image(self, session: aiohttp.ClientSession, url: str) -> Image.Image | None:  # Download single image
-        for _ in range(RETRY_ATTEMPTS):
-            try:
-                async with session.get(url, timeout=aiohttp.ClientTimeout(total=DOWNLOAD_TIMEOUT)) as resp:
-                    if resp.status == 200:
-                        data = await resp.read()
-                        return Image.open(io.BytesIO(data)).convert("RGB")
-            except: pass
-        return None
-
-    async def _process_batch(self, session: aiohttp.ClientSession, batch: list[dict]) -> list[dict]:  # Process a batch: download → embed → prepare records
-        tasks = [self._download_image(session, row["url"]) for row in batch]
-        images = await asyncio.gather(*tasks)
-        
-        valid_rows, valid_imgs, texts, weights = [], [], [], []
-        for row, img in zip(batch, images):
-            if img is None: continue
-            valid_rows.append(row)
-            valid_imgs.append(img)
-            texts.append(self._build_text(row))
-            weights.append(get_text_weight(row.get("title", ""), row.get("alt_text", "")))
-        
-        if not valid_imgs: return []
-        embeddings = self._embed_batch(valid_imgs, texts, weights)
-        
-        records = []
-        for row, emb in zip(valid_rows, embeddings):
-            records.append({
-                "content_hash": row["content_hash"], "image_url": row["url"],
-                "category": row["category"], "category_type": row["category_type"],
-                "search_term": row["search_term"], "title": row.get("title", ""),
-                "alt_text": row.get("alt_text", ""), "embedding": emb.tolist()
-            })
+    def _embed_tensors(self, img_tensors: torch.Tensor, texts: list[str], weights: list[float]) -> np.ndarray:  # Batch embed preprocessed images + texts with dynamic fusion
+        return self._fuse(*self._encode(img_tensors, texts), weights)
+
+    def _embed_batch(self, images: list[Image.Image], texts: list[str], weights: list[float]) -> np.ndarray:  # PIL entry point (preprocess inline)
+        return self._embed_tensors(torch.stack([self.preprocess(img) for img in images]), texts, weights)
+
+    def _forward(self, rows: list[dict], pixels: np.ndarray) -> list[dict]:  # Forward stage body (inference thread): normalized NCHW batch → upload records
+        texts = [self._build_text(row) for row in rows]
+        weights = [get_text_weight(row.get("title", ""), row.get("alt_text", "")) for row in rows]
+        img_embs, txt_embs = self._encode(torch.from_numpy(pixels), texts)
+        flags = [(TEXT_TITLE if row.get("title") else 0) | (TEXT_ALT if row.get("alt_text") else 0) for row in rows]
+        self.components.append([row["content_hash"] for row in rows], image=img_embs, text=txt_embs, flags=np.array(flags, dtype=np.uint8))  # Pre-fusion vectors: LAION head, re-fusion, image-only search
+        fused = self._fuse(img_embs, txt_embs, weights)
+        records = [self._record(row, emb) for row, emb in zip(rows, fused)]
+        if self.assigner:  # cluster_id rides along in the same upsert: no separate write-back
+            for record, cluster_id in zip(records, self.assigner.assign(fused).tolist()): record["cluster_id"] = cluster_id
         return records
 
-    def load_csv(self) -> list[dict]:  # Load master dataset
-        with open(MASTER_CSV, "r", encoding="utf-8") as f:
-            return list(csv.DictReader(f))
+    @staticmethod
+    def _record(row: dict, emb: np.ndarray) -> dict:
+        return {
+            "content_hash": row["content_hash"], "image_url": row["url"],
+            "category": row["category"], "category_type": row["category_type"],
+            "search_term": row["search_term"], "title": row.get("title", ""),
+            "alt_text": row.get("alt_text", ""), "embedding": emb.tolist()
+        }
+
+    async def _download_bytes(self, session: aiohttp.ClientSession, row: dict) -> bytes | None:  # Downsized image bytes via the shared cache (decoding is its own stage)
+        return await get_image_cache().fetch(session, row["content_hash"], row["url"], DOWNLOAD_TIMEOUT, RETRY_ATTEMPTS)
+
+    def _refresh_assigner(self):  # Per run: a cached pipeline must follow refits (new generation → new centers) and a first artifact appearing
+        if not self.assign_clusters: return
+        from clustering.cluster_artifact import artifact_exists, artifact_generation
+        from clustering.assign_clusters import ClusterAssigner
+        if not artifact_exists():
+            print("⚠️ No cluster artifact yet: uploading without cluster_id")
+            self.assigner = None
+        elif self.assigner is None or self.assigner.generation != artifact_generation():
+            self.assigner = ClusterAssigner()
 
-    async def run(self, limit: int = None, skip_existing: set[str] = None):  # Main pipeline
-        rows = self.load_csv()
-        if limit: rows = rows[:limit]
-        if skip_existing: rows = [r for r in rows if r["content_hash"] not in skip_existing]
+    async def run(self, limit: int = None, skip_existing: set[str] = None, restart: bool = False, rows: list[dict] = None):  # Main pipeline: staged download → decode → forward → upload (MASTER_CSV, or the given rows)
+        self._refresh_assigner()
+        ledger = HashLedger(EMBED_LEDGER)
+        if rows is None:
+            checkpoint = CsvCheckpoint(EMBED_CHECKPOINT, MASTER_CSV)
+            if restart: checkpoint.reset()
+            start = checkpoint.load()
+            print(f"📊 Streaming {MASTER_CSV.name} from byte {start:,} in batches of {BATCH_SIZE}")
+        else:
+            checkpoint, start = _RowsCheckpoint(), 0
+            print(f"📊 Embedding {len(rows)} rows in batches of {BATCH_SIZE}")
+        self.uploaded, self.failed = 0, 0
+        self.busy = dict.fromkeys(["download", "decode", "forward", "upload"], 0.0)  # Per-stage busy seconds: the largest is the bottleneck
+        depth = BATCH_SIZE * EMBED_QUEUE_BATCHES
+        rows_q, fetched_q, ready_q, upload_q = asyncio.Queue(depth), asyncio.Queue(depth), asyncio.Queue(), asyncio.Queue(EMBED_QUEUE_BATCHES)
+        n_slots = BATCH_SIZE * (EMBED_QUEUE_BATCHES + 1) + 2 * EMBED_DECODE_WORKERS  # ≥ one full batch + decodes in flight, so forward can't starve
+        free_slots = asyncio.Queue()  # Shared-memory slots double as the bound on decoded-but-not-embedded images
+        for i in range(n_slots): free_slots.put_nowait(i)
+        loop = asyncio.get_running_loop()
+        progress = tqdm(desc="Images")
         
-        print(f"📊 Processing {len(rows)} images in batches of {BATCH_SIZE}")
-        total_uploaded, failed = 0, 0
+        async def stage(worker, n: int, out_q: asyncio.Queue, n_out: int):  # n workers; once all exit, send one sentinel per downstream worker
+            await asyncio.gather(*[worker() for _ in range(n)])
+            for _ in range(n_out): await out_q.put(None)
+        
+        def finish(rows: list[dict], ok: int = 0):  # Rows leave the pipeline; the watermark moves in committed() (or drop() for dead rows)
+            self.uploaded += ok
+            self.failed += len(rows) - ok
+            progress.update(len(rows))
+        
+        ticket_lock = threading.Lock()  # checkpoint.done() is called from the loop (drop) and bulk_upsert pool threads (committed)
+        def drop(row: dict):  # Permanent failure (dead URL, undecodable image): nothing to retry, let the watermark pass it
+            finish([row])
+            with ticket_lock: checkpoint.done(row["_ticket"])
+        
+        async def feed():  # Generator → queue: only the bounded queues' worth of rows is ever in memory
+            batches = iter_batches(MASTER_CSV, BATCH_SIZE, start, limit, skip_existing) if rows is None else [[(row, 0) for row in rows[i:i + BATCH_SIZE]] for i in range(0, len(rows), BATCH_SIZE)]
+            for batch in batches:
+                for row, end in batch:
+                    row["_ticket"] = checkpoint.track(end)
+                    await rows_q.put(row)
+        
+        async def download():
+            while (row := await rows_q.get()) is not None:
+                t0 = time.perf_counter()
+                data = await self._download_bytes(session, row)
+                self.busy["download"] += time.perf_counter() - t0
+                if data is None: drop(row)
+                else: await fetched_q.put((row, data))
+        
+        async def decode():  # 2 tasks per worker process keep the pool saturated across IPC round-trips
+            while (item := await fetched_q.get()) is not None:
+                slot = await free_slots.get()
+                t0 = time.perf_counter()
+                ok = await asyncio.wrap_future(pool.decode(slot, item[1]))
+                self.busy["decode"] += time.perf_counter() - t0
+                if ok: await ready_q.put((item[0], slot))
+                else:
+                    free_slots.put_nowait(slot)
+                    drop(item[0])
+        
+        async def forward():  # Single consumer: fills full batches, runs the model off-loop so downloads keep flowing
+            batch, done = [], False
+            while not done:
+                item = await ready_q.get()
+                if item is None: done = True
+                else: batch.append(item)
+                if batch and (done or len(batch) >= BATCH_SIZE):
+                    t0 = time.perf_counter()
+                    rows_b, slots = [row for row, _ in batch], [slot for _, slot in batch]
+                    pixels = await loop.run_in_executor(infer_pool, pool.batch, slots)  # One vectorized uint8 → normalized float32 op per batch, off-loop
+                    for slot in slots: free_slots.put_nowait(slot)
+                    try: records = await loop.run_in_executor(infer_pool, self._forward, rows_b, pixels)
+                    except Exception as e:
+                        print(f"⚠️ Forward failed for {len(batch)} images: {e}")
+                        finish(rows_b)  # Transient: tickets stay open, so the checkpoint holds and the next run retries them
+                        records = []
+                    self.busy["forward"] += time.perf_counter() - t0
+                    if records: await upload_q.put((rows_b, records))
+                    batch = []
+        
+        def committed(chunk: list[dict], tickets: dict[str, list[int]]):  # Ledger, cluster sizes and the checkpoint record exactly the committed chunks
+            ledger.append_records(chunk)
+            if self.assigner: self.assigner.record(chunk)
+            with ticket_lock:
+                for record in chunk: checkpoint.done(tickets[record["content_hash"]].pop())
+        
+        async def upload():  # Coalesces whatever forward batches are already queued into one bulk upsert
+            done = False
+            while not done and (item := await upload_q.get()) is not None:
+                rows_b, records = list(item[0]), list(item[1])
+                while len(records) < BULK_UPSERT_CHUNK and not upload_q.empty():
+                    if (item := upload_q.get_nowait()) is None:
+                        done = True  # Our sentinel: flush what we hold, then exit
+                        break
+                    rows_b += item[0]; records += item[1]
+                tickets = {}
+                for row in rows_b: tickets.setdefault(row["content_hash"], []).append(row["_ticket"])
+                t0 = time.perf_counter()
+                success = await asyncio.to_thread(bulk_upsert, records, on_chunk=lambda chunk: committed(chunk, tickets))
+                self.busy["upload"] += time.perf_counter() - t0
+                finish(rows_b, success)
+                checkpoint.save()
         
         connector = aiohttp.TCPConnector(limit=MAX_CONCURRENT_DOWNLOADS)
-        async with aiohttp.ClientSession(connector=connector) as session:
-            for i in tqdm(range(0, len(rows), BATCH_SIZE), desc="Batches"):
-                batch = rows[i:i + BATCH_SIZE]
-                records = await self._process_batch(session, batch)
-                if records:
-                    success = upsert_batch(records)
-                    total_uploaded += success
-                    failed += len(records) - success
-                await asyncio.sleep(0.1)  # Rate limit
+        t_start = time.perf_counter()
+        mean, std = getattr(self.model.visual, "image_mean", None) or CLIP_MEAN, getattr(self.model.visual, "image_std", None) or CLIP_STD
+        with PreprocessPool(n_slots, IMAGE_SIZE, EMBED_DECODE_WORKERS, mean, std) as pool, ThreadPoolExecutor(1, thread_name_prefix="embed-forward") as infer_pool:
+            async with aiohttp.ClientSession(connector=connector) as session:
+                await asyncio.gather(
+                    stage(feed, 1, rows_q, MAX_CONCURRENT_DOWNLOADS),
+                    stage(download, MAX_CONCURRENT_DOWNLOADS, fetched_q, 2 * EMBED_DECODE_WORKERS),
+                    stage(decode, 2 * EMBED_DECODE_WORKERS, ready_q, 1),
+                    stage(forward, 1, upload_q, EMBED_UPLOAD_WORKERS),
+                    stage(upload, EMBED_UPLOAD_WORKERS, upload_q, 0),
+                )
+        progress.close()
+        self.components.flush()
+        if self.assigner: self.assigner.flush()
+        checkpoint.save()
         
-        print(f"\n✅ Done: {total_uploaded} uploaded, {failed} failed")
-        return total_uploaded
+        wall = time.perf_counter() - t_start
+        workers = {"download": MAX_CONCURRENT_DOWNLOADS, "decode": 2 * EMBED_DECODE_WORKERS, "forward": 1, "upload": EMBED_UPLOAD_WORKERS}
+        print("⏱️ Stage busy time (per worker): " + ", ".join(f"{k} {v / workers[k]:.1f}s" for k, v in self.busy.items()) + f" | wall {wall:.1f}s")
+        print(f"\n✅ Done: {self.uploaded} uploaded, {self.failed} failed")
+        if checkpoint.pending(): print(f"   Checkpoint held at byte {checkpoint.offset:,} (first row not uploaded); the next run retries from there (--resume skips rows already uploaded)")
+        return self.uploaded
+
+_pipeline: EmbeddingPipeline | None = None
+
+def process_batch_streaming(rows: list[dict], assign_clusters: bool = True) -> int:  # Embed + upload given rows (url, content_hash, category, ...) through the staged pipeline; model loaded once per process
+    global _pipeline
+    if _pipeline is None: _pipeline = EmbeddingPipeline(assign_clusters=assign_clusters)
+    return asyncio.run(_pipeline.run(rows=rows))
 
 def main():
     import argparse
     parser = argparse.ArgumentParser(description="Streaming embedding pipeline")
-    parser.add_argument("--limit", type=int, help="Process only first N images")
+    parser.add_argument("--limit", type=int, help="Process only the first N CSV rows (counted from the top of the file, also on resume)")
     parser.add_argument("--resume", action="store_true", help="Skip already processed images")
+    parser.add_argument("--restart", action="store_true", help="Ignore the byte-offset checkpoint and rescan the CSV from the top")
+    parser.add_argument("--backend", default=INFERENCE_BACKEND, choices=BACKENDS, help="Inference mode (see embedding.bench_backends)")
+    parser.add_argument("--resume-db", action="store_true", help="With --resume: rebuild the skip set from Supabase hashes instead of the local ledger")
+    parser.add_argument("--assign", action="store_true", help="Upload each image with its nearest existing cluster_id (needs output/clusters/)")
     args = parser.parse_args()
     
     skip = set()
     if args.resume:
-        from vector_db.supabase_client import get_all_embeddings
-        print("📂 Fetching existing embeddings...")
-        existing = get_all_embeddings()
-        skip = {r["content_hash"] for r in existing}
-        print(f"   Skipping {len(skip)} already processed")
+        ledger = HashLedger(EMBED_LEDGER)
+        if ledger.exists() and not args.resume_db:
+            skip = ledger.load()
+            print(f"📒 Ledger: skipping {len(skip)} already uploaded")
+        else:
+            from vector_db.supabase_client import get_all_content_hashes
+            print("📂 Fetching existing content hashes...")
+            skip = get_all_content_hashes()
+            ledger.rewrite(skip)  # Seed the ledger so the next resume stays local
+            print(f"   Skipping {len(skip)} already processed")
     
-    pipeline = EmbeddingPipeline()
-    asyncio.run(pipeline.run(limit=args.limit, skip_existing=skip if skip else None))
+    pipeline = EmbeddingPipeline(args.backend, assign_clusters=args.assign)
+    asyncio.run(pipeline.run(limit=args.limit, skip_existing=skip if skip else None, restart=args.restart))
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,36 @@
+import os, threading # Append-only local ledger of content_hashes confirmed uploaded (cheap --resume without touching Supabase)
+from pathlib import Path
+
+class HashLedger:
+    """One hash per line, appended after each committed upsert chunk. A torn last line from a crash is dropped on load."""
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._lock = threading.Lock()  # Upload workers append from several threads
+
+    def exists(self) -> bool:
+        return self.path.exists()
+
+    def load(self) -> set[str]:
+        if not self.path.exists(): return set()
+        with open(self.path, "rb") as f: data = f.read()
+        if not data.endswith(b"\n"): data = data[:data.rfind(b"\n") + 1]  # Partial write at crash time
+        return set(data.decode().split())
+
+    def append(self, hashes: list[str]):
+        if not hashes: return
+        with self._lock:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.path, "a") as f:
+                f.write("\n".join(hashes) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+
+    def append_records(self, records: list[dict]):  # upsert_batch on_chunk callback
+        self.append([r["content_hash"] for r in records])
+
+    def rewrite(self, hashes: set[str]):  # Seed/compact from an authoritative hash set
+        tmp = self.path.with_suffix(".tmp")
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            with open(tmp, "w") as f: f.write("".join(h + "\n" for h in sorted(hashes)))
+            os.replace(tmp, self.path)
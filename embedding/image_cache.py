@@ -0,0 +1,105 @@
+import asyncio, hashlib, os, sqlite3, sys, threading, time # Content-addressed on-disk cache of downsized image bytes, shared by every downloader
+import aiohttp
+from io import BytesIO
+from pathlib import Path
+from PIL import Image
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from settings import IMAGE_CACHE_DIR, IMAGE_CACHE_MAX_GB, IMAGE_CACHE_MAX_SIDE
+
+EVICT_CHECK_EVERY = 64  # puts between SUM(size) checks
+EVICT_TO = 0.9  # Evict down to 90% of the budget so eviction isn't triggered by every put
+
+def url_hash(url: str) -> str:  # Same content_hash the scrapers assign (md5(url)[:12]), for callers that only have a URL
+    return hashlib.md5(url.encode()).hexdigest()[:12]
+
+def downsize(data: bytes, max_side: int = IMAGE_CACHE_MAX_SIDE) -> bytes:  # Shortest side <= max_side (>= every consumer's input size); small JPEGs pass through untouched
+    img = Image.open(BytesIO(data))
+    if img.format == "JPEG" and min(img.size) <= max_side: return data
+    img.draft("RGB", (max_side, max_side))
+    img = img.convert("RGB")
+    scale = max_side / min(img.size)
+    if scale < 1: img = img.resize((max(max_side, round(img.width * scale)), max(max_side, round(img.height * scale))), Image.BICUBIC)
+    out = BytesIO()
+    img.save(out, "JPEG", quality=90)
+    return out.getvalue()
+
+class ImageCache:
+    """Files at root/ab/<content_hash>.jpg; SQLite index (WAL, safe across processes) tracks size + last access for LRU eviction."""
+    def __init__(self, root: Path = IMAGE_CACHE_DIR, max_bytes: int = int(IMAGE_CACHE_MAX_GB * 1e9), max_side: int = IMAGE_CACHE_MAX_SIDE):
+        self.root, self.max_bytes, self.max_side = Path(root), max_bytes, max_side
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.hits, self.misses, self._puts = 0, 0, 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.root / "index.sqlite", check_same_thread=False, isolation_level=None, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS entries (content_hash TEXT PRIMARY KEY, size INTEGER NOT NULL, atime REAL NOT NULL)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS entries_atime ON entries (atime)")
+
+    def _path(self, content_hash: str) -> Path:
+        return self.root / content_hash[:2] / f"{content_hash}.jpg"
+
+    def get(self, content_hash: str) -> bytes | None:
+        try: data = self._path(content_hash).read_bytes()
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+                self._db.execute("DELETE FROM entries WHERE content_hash = ?", (content_hash,))  # Evicted by another process / removed by hand
+            return None
+        with self._lock:
+            self.hits += 1
+            self._db.execute("UPDATE entries SET atime = ? WHERE content_hash = ?", (time.time(), content_hash))
+        return data
+
+    def put(self, content_hash: str, data: bytes) -> bytes:  # Raises if the bytes aren't a decodable image; returns what was stored
+        small = downsize(data, self.max_side)
+        path = self._path(content_hash)
+        path.parent.mkdir(exist_ok=True)
+        tmp = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp.write_bytes(small)
+        os.replace(tmp, path)
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO entries VALUES (?, ?, ?)", (content_hash, len(small), time.time()))
+            self._puts += 1
+            if self._puts % EVICT_CHECK_EVERY == 0: self._evict()
+        return small
+
+    def _evict(self):  # Oldest-access first until back under EVICT_TO × budget (caller holds the lock)
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes: return
+        target = total - self.max_bytes * EVICT_TO
+        for content_hash, size in self._db.execute("SELECT content_hash, size FROM entries ORDER BY atime").fetchall():
+            if target <= 0: break
+            self._path(content_hash).unlink(missing_ok=True)
+            self._db.execute("DELETE FROM entries WHERE content_hash = ?", (content_hash,))
+            target -= size
+
+    async def fetch(self, session: aiohttp.ClientSession, content_hash: str, url: str, timeout: float | None = None, retries: int = 1) -> bytes | None:
+        """Read-through: local bytes if cached, else download + downsize + store (disk/PIL work runs in a thread). None if unavailable."""
+        data = await asyncio.to_thread(self.get, content_hash)
+        if data is not None: return data
+        for _ in range(retries):
+            try:
+                async with session.get(url, **({"timeout": aiohttp.ClientTimeout(total=timeout)} if timeout else {})) as resp:  # else the session's timeout
+                    if resp.status == 200:
+                        data = await resp.read()
+                        break
+            except Exception: pass
+        if data is None: return None
+        try: return await asyncio.to_thread(self.put, content_hash, data)
+        except Exception: return None  # Not an image (HTML error page, truncated body)
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries, total = self._db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+            lookups = self.hits + self.misses
+            return {"entries": entries, "bytes": total, "max_bytes": self.max_bytes, "hits": self.hits, "misses": self.misses, "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0}
+
+_cache: ImageCache | None = None
+_cache_lock = threading.Lock()
+
+def get_image_cache() -> ImageCache:  # Process-wide singleton (one SQLite connection per process)
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None: _cache = ImageCache()
+    return _cache
@@ -0,0 +1,75 @@
+import sys, contextlib # Selectable CLIP inference backends: fp32 | bf16 | int8 | compile | onnx
+import torch
+import open_clip
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from settings import CLIP_MODEL, CLIP_PRETRAINED, INFERENCE_BACKEND, ONNX_CACHE_DIR
+
+BACKENDS = ("fp32", "bf16", "int8", "compile", "onnx")
+CPU_ONLY = {"int8", "onnx"}  # Dynamic qint8 kernels and the ONNX Runtime CPU provider
+
+def pick_device(backend: str = INFERENCE_BACKEND) -> str:
+    if backend in CPU_ONLY: return "cpu"
+    return "mps" if torch.backends.mps.is_available() else "cuda" if torch.cuda.is_available() else "cpu"
+
+class ClipBackend:
+    """encode_image / encode_text with the same contract for every mode: torch in, unnormalized float32 torch out."""
+    def __init__(self, model, backend: str, device: str):
+        self.model, self.backend, self.device = model, backend, device
+        self.visual = model.visual  # image_mean / image_std for preprocessing
+        self._ort = None
+        if backend == "int8":
+            self.model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)  # MLP + QKV weights → int8, activations quantized per call
+        elif backend == "compile":
+            model.visual.to(memory_format=torch.channels_last)
+            model.visual = torch.compile(model.visual)
+            if hasattr(model, "transformer"): model.transformer = torch.compile(model.transformer)
+        elif backend == "onnx":
+            self._ort = _onnx_sessions(model)
+
+    def _autocast(self):  # bf16 matmuls (AMX/AVX512-BF16 on CPU); every other mode runs as built
+        return torch.autocast(device_type=self.device, dtype=torch.bfloat16) if self.backend == "bf16" else contextlib.nullcontext()
+
+    @torch.no_grad()
+    def encode_image(self, pixels: torch.Tensor) -> torch.Tensor:
+        if self._ort is not None: return torch.from_numpy(self._ort["image"].run(None, {"pixels": pixels.float().cpu().numpy()})[0])
+        pixels = pixels.to(self.device)
+        if self.backend == "compile": pixels = pixels.contiguous(memory_format=torch.channels_last)
+        with self._autocast(): return self.model.encode_image(pixels).float()
+
+    @torch.no_grad()
+    def encode_text(self, tokens: torch.Tensor) -> torch.Tensor:
+        if self._ort is not None: return torch.from_numpy(self._ort["text"].run(None, {"tokens": tokens.cpu().numpy()})[0])
+        with self._autocast(): return self.model.encode_text(tokens.to(self.device)).float()
+
+class _Tower(torch.nn.Module):  # Export wrapper: one encode_* method as forward()
+    def __init__(self, model, kind: str):
+        super().__init__()
+        self.model, self.kind = model, kind
+    def forward(self, x): return self.model.encode_image(x) if self.kind == "image" else self.model.encode_text(x)
+
+def _onnx_sessions(model) -> dict:  # Export each tower once per model/pretrained, then reuse the cached .onnx files
+    try: import onnxruntime as ort
+    except ImportError as e: raise ImportError("INFERENCE_BACKEND=onnx needs onnxruntime (and onnx for the first export)") from e
+    out = ONNX_CACHE_DIR / f"{CLIP_MODEL}-{CLIP_PRETRAINED}"
+    out.mkdir(parents=True, exist_ok=True)
+    examples = {"image": ("pixels", torch.zeros(1, 3, 224, 224)), "text": ("tokens", open_clip.get_tokenizer(CLIP_MODEL)(["a photo"]))}
+    sessions = {}
+    for kind, (name, example) in examples.items():
+        path = out / f"{kind}.onnx"
+        if not path.exists():
+            print(f"📦 Exporting {kind} tower to {path}...")
+            tmp = path.with_suffix(".tmp.onnx")
+            torch.onnx.export(_Tower(model.float().cpu().eval(), kind), example, tmp, input_names=[name], output_names=["embedding"], dynamic_axes={name: {0: "batch"}, "embedding": {0: "batch"}}, opset_version=17)
+            tmp.replace(path)
+        opts = ort.SessionOptions()
+        opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        sessions[kind] = ort.InferenceSession(str(path), opts, providers=["CPUExecutionProvider"])
+    return sessions
+
+def load_clip(backend: str = INFERENCE_BACKEND, device: str | None = None) -> tuple[ClipBackend, object, object]:  # (backend, preprocess, tokenizer)
+    if backend not in BACKENDS: raise ValueError(f"Unknown INFERENCE_BACKEND {backend!r}; choose from {', '.join(BACKENDS)}")
+    device = device or pick_device(backend)
+    model, _, preprocess = open_clip.create_model_and_transforms(CLIP_MODEL, pretrained=CLIP_PRETRAINED, device=device)
+    model.eval()
+    return ClipBackend(model, backend, device), preprocess, open_clip.get_tokenizer(CLIP_MODEL)
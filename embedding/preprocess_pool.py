@@ -0,0 +1,62 @@
+import multiprocessing as mp # Process-pool image decode + CLIP preprocess into shared-memory uint8 slots
+import numpy as np
+from io import BytesIO
+from PIL import Image
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+CLIP_MEAN = (0.48145466, 0.4578275, 0.40821073)  # open_clip OPENAI_DATASET_MEAN/STD (laion2b ViT-L-14 uses the same)
+CLIP_STD = (0.26862954, 0.26130258, 0.27577711)
+
+_slots: np.ndarray | None = None  # Worker-side view of the shared slot array
+_shm: shared_memory.SharedMemory | None = None
+
+def _attach(name: str, shape: tuple):  # Worker initializer: map the parent's block once per process
+    global _shm, _slots
+    try: _shm = shared_memory.SharedMemory(name=name, track=False)  # 3.13+: parent owns the unlink
+    except TypeError: _shm = shared_memory.SharedMemory(name=name)
+    _slots = np.ndarray(shape, dtype=np.uint8, buffer=_shm.buf)
+
+def decode_to_array(data: bytes, size: int) -> np.ndarray:  # Reduced-size JPEG decode → shortest-side bicubic resize → center crop (CLIP transform order)
+    img = Image.open(BytesIO(data))
+    img.draft("RGB", (size * 2, size * 2))  # JPEG DCT scaling: /originals/ decode at >= 2x target instead of full res
+    img = img.convert("RGB")
+    scale = size / min(img.size)
+    img = img.resize((max(size, round(img.width * scale)), max(size, round(img.height * scale))), Image.BICUBIC)
+    left, top = (img.width - size) // 2, (img.height - size) // 2
+    return np.asarray(img.crop((left, top, left + size, top + size)), dtype=np.uint8)
+
+def _decode_into(slot: int, data: bytes) -> bool:  # Runs in a worker: only a bool crosses the pipe back
+    try: _slots[slot] = decode_to_array(data, _slots.shape[1])
+    except Exception: return False
+    return True
+
+class PreprocessPool:
+    """Decode workers write HWC uint8 images into fixed slots of one shared block; the parent turns a batch of slots
+    into a normalized NCHW float32 array in a single vectorized op. Callers own slot lifetime (acquire → decode → batch → release)."""
+    def __init__(self, n_slots: int, size: int = 224, workers: int = 4, mean: tuple = CLIP_MEAN, std: tuple = CLIP_STD):
+        self.n_slots, self.size = n_slots, size
+        shape = (n_slots, size, size, 3)
+        self._shm = shared_memory.SharedMemory(create=True, size=int(np.prod(shape)))
+        self.slots = np.ndarray(shape, dtype=np.uint8, buffer=self._shm.buf)
+        self._scale = (1 / (255 * np.asarray(std, dtype=np.float32))).reshape(1, 3, 1, 1)  # (x/255 - mean)/std == x*scale + offset
+        self._offset = (-np.asarray(mean, dtype=np.float32) / np.asarray(std, dtype=np.float32)).reshape(1, 3, 1, 1)
+        self.executor = ProcessPoolExecutor(max_workers=workers, mp_context=mp.get_context("spawn"), initializer=_attach, initargs=(self._shm.name, shape))  # spawn: never fork a process holding torch/MPS state
+
+    def decode(self, slot: int, data: bytes):  # Future[bool]; wrap with asyncio.wrap_future in async callers
+        return self.executor.submit(_decode_into, slot, data)
+
+    def batch(self, slots: list[int]) -> np.ndarray:  # (B, 3, S, S) float32, model-ready; copies out so slots can be released immediately
+        x = self.slots[slots].transpose(0, 3, 1, 2).astype(np.float32)
+        x *= self._scale
+        x += self._offset
+        return np.ascontiguousarray(x)
+
+    def close(self):
+        self.executor.shutdown(wait=True, cancel_futures=True)
+        del self.slots
+        self._shm.close()
+        self._shm.unlink()
+
+    def __enter__(self): return self
+    def __exit__(self, *exc): self.close()
@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""Offline re-fusion: rebuild fused vectors from stored image/text components with new text weights (no download, no CLIP)"""
+import sys
+import numpy as np
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from embedding.config_embed import OUTPUT_DIR, EMBED_DIM, get_text_weight
+from embedding.component_store import ComponentStore, TEXT_TITLE, TEXT_ALT
+
+REFUSED_DIR = OUTPUT_DIR / "refused"
+BLOCK = 65536
+
+def weight_table(both: float = None, one: float = None, none: float = None) -> np.ndarray:  # flags (0..3) → text weight; defaults = current get_text_weight
+    table = np.array([get_text_weight("", ""), get_text_weight("t", ""), get_text_weight("", "a"), get_text_weight("t", "a")], dtype=np.float32)
+    if none is not None: table[0] = none
+    if one is not None: table[TEXT_TITLE] = table[TEXT_ALT] = one
+    if both is not None: table[TEXT_TITLE | TEXT_ALT] = both
+    return table
+
+def refuse(table: np.ndarray, out_tag: str) -> tuple[list[str], np.ndarray]:  # Blockwise normalize(img + w[flags] * txt) → memmapped float32 (N, D)
+    hashes, comp = ComponentStore().load_many(["image", "text", "flags"])
+    if not hashes: raise FileNotFoundError("No stored image/text components (run embedding.embed_pipeline)")
+    REFUSED_DIR.mkdir(parents=True, exist_ok=True)
+    out = np.lib.format.open_memmap(REFUSED_DIR / f"{out_tag}.fused.npy", mode="w+", dtype=np.float32, shape=(len(hashes), EMBED_DIM))
+    for i in range(0, len(hashes), BLOCK):
+        img = comp["image"][i:i + BLOCK].astype(np.float32)
+        fused = img + table[comp["flags"][i:i + BLOCK]][:, None] * comp["text"][i:i + BLOCK].astype(np.float32)
+        out[i:i + BLOCK] = fused / np.linalg.norm(fused, axis=1, keepdims=True)
+    out.flush()
+    np.save(REFUSED_DIR / f"{out_tag}.hashes.npy", np.asarray(hashes, dtype=str))
+    return hashes, out
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description="Re-fuse stored image/text embeddings with new text weights")
+    parser.add_argument("--both", type=float, help="Text weight when title and alt_text exist")
+    parser.add_argument("--one", type=float, help="Text weight when only one of title / alt_text exists")
+    parser.add_argument("--none", type=float, help="Text weight when neither exists (category/search_term only)")
+    parser.add_argument("--image-only", action="store_true", help="All weights 0 (image-only vectors)")
+    parser.add_argument("--tag", default="refused", help=f"Output name under {REFUSED_DIR}")
+    parser.add_argument("--apply-local", action="store_true", help="Overwrite matching rows of the local embedding store (ANN index / clustering read it)")
+    args = parser.parse_args()
+    table = np.zeros(4, dtype=np.float32) if args.image_only else weight_table(args.both, args.one, args.none)
+    print(f"⚖️ Text weights by flags [none, title, alt, both]: {table.round(3).tolist()}")
+    hashes, fused = refuse(table, args.tag)
+    print(f"💾 Re-fused {len(hashes)} vectors → {REFUSED_DIR / args.tag}.fused.npy")
+    if args.apply_local:
+        from vector_db.local_store import LocalEmbeddingStore
+        n = LocalEmbeddingStore().replace_embeddings(hashes, fused)
+        print(f"✅ Replaced {n} rows in the local embedding store (Supabase unchanged until re-uploaded)")
+
+if __name__ == "__main__":
+    main()
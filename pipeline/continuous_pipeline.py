@@ -1,5 +1,5 @@
 #!/usr/bin/env python3
-"""Continuous Pipeline: Detect new images → Embed → Q-Align → Cluster
+"""Continuous Pipeline: Detect new images → Embed → Cluster (incremental) → Q-Align
 Run as daemon or cron job to process new scraped images automatically
 """
 import json, sys, time
@@ -70,27 +70,24 @@ def embed_new_images(images: list[dict]) -> int:
     try:
         # Import embedding pipeline
         from embedding.embed_pipeline import process_batch_streaming
-        from embedding.config_embed import BATCH_SIZE
         
-        success = 0
-        for i in range(0, len(images), BATCH_SIZE):
-            batch = images[i:i + BATCH_SIZE]
-            # Convert to format expected by embed_pipeline
-            batch_data = [{
-                "url": img["url"],
-                "content_hash": img["content_hash"],
-                "category": img.get("search_term", img.get("category", "unknown")),
-                "category_type": img.get("category_type", "unknown"),
-                "search_term": img.get("search_term", ""),
-                "title": img.get("title", ""),
-                "alt_text": img.get("alt_text", "")
-            } for img in batch]
-            
-            try:
-                result = process_batch_streaming(batch_data)
-                success += result
-            except Exception as e:
-                log(f"   ⚠️ Batch error: {e}")
+        # Convert to format expected by embed_pipeline
+        rows = [{
+            "url": img["url"],
+            "content_hash": img["content_hash"],
+            "category": img.get("search_term", img.get("category", "unknown")),
+            "category_type": img.get("category_type", "unknown"),
+            "search_term": img.get("search_term", ""),
+            "title": img.get("title", ""),
+            "alt_text": img.get("alt_text", "")
+        } for img in images]
+        
+        try:
+            # One staged run for all new images; each is uploaded with its nearest cluster_id and /clusters sizes follow
+            success = process_batch_streaming(rows, assign_clusters=True)
+        except Exception as e:
+            log(f"   ⚠️ Embedding error: {e}")
+            success = 0
         
         log(f"   ✅ Embedded {success} images")
         return success
@@ -145,7 +142,21 @@ def qalign_new_images(limit: int = 100) -> int:
         log(f"   ❌ Error: {e}")
         return 0
 
-def run_pipeline_once(embed: bool = True, qalign: bool = True, qalign_limit: int = 100):
+def recluster_new_images() -> int:
+    """Fold new embeddings into the clusters (mini-batch update; full refit only on drift)"""
+    log("🔄 Incremental re-clustering...")
+    
+    try:
+        from clustering.incremental_kmeans import run_incremental
+        clusters = run_incremental(update_db=True, sync=True)
+        log(f"   ✅ {len(clusters)} clusters updated")
+        return len(clusters)
+        
+    except Exception as e:
+        log(f"   ❌ Error: {e}")
+        return 0
+
+def run_pipeline_once(embed: bool = True, qalign: bool = True, qalign_limit: int = 100, cluster: bool = True):
     """Run one iteration of the pipeline"""
     log("=" * 50)
     log("🚀 Pipeline iteration starting...")
@@ -163,6 +174,9 @@ def run_pipeline_once(embed: bool = True, qalign: bool = True, qalign_limit: int
             for img in new_images:
                 processed.add(img["content_hash"])
             save_processed_hashes(processed)
+            
+            if cluster and embedded:
+                recluster_new_images()
         else:
             log("📥 No new images from scrapers")
     
@@ -173,13 +187,13 @@ def run_pipeline_once(embed: bool = True, qalign: bool = True, qalign_limit: int
     log("✅ Pipeline iteration complete")
     log("=" * 50)
 
-def run_daemon(interval_minutes: int = 30, embed: bool = True, qalign: bool = True):
+def run_daemon(interval_minutes: int = 30, embed: bool = True, qalign: bool = True, cluster: bool = True):
     """Run pipeline continuously as a daemon"""
     log(f"🔄 Starting pipeline daemon (interval: {interval_minutes} min)")
     
     while True:
         try:
-            run_pipeline_once(embed=embed, qalign=qalign)
+            run_pipeline_once(embed=embed, qalign=qalign, cluster=cluster)
         except Exception as e:
             log(f"❌ Pipeline error: {e}")
         
@@ -194,19 +208,22 @@ def main():
     parser.add_argument("--no-embed", action="store_true", help="Skip embedding")
     parser.add_argument("--no-qalign", action="store_true", help="Skip Q-Align")
     parser.add_argument("--qalign-limit", type=int, default=100, help="Max images to Q-Align per iteration")
+    parser.add_argument("--no-cluster", action="store_true", help="Skip incremental re-clustering of new embeddings")
     args = parser.parse_args()
     
     if args.once:
         run_pipeline_once(
             embed=not args.no_embed, 
             qalign=not args.no_qalign,
-            qalign_limit=args.qalign_limit
+            qalign_limit=args.qalign_limit,
+            cluster=not args.no_cluster
         )
     else:
         run_daemon(
             interval_minutes=args.interval,
             embed=not args.no_embed,
-            qalign=not args.no_qalign
+            qalign=not args.no_qalign,
+            cluster=not args.no_cluster
         )
 
 if __name__ == "__main__":
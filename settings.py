@@ -1,13 +1,16 @@
 #!/usr/bin/env python3
 """Unified settings for Style Universe - consolidates all config"""
+import os
 from pathlib import Path
 
 # === PATHS ===
 PROJECT_ROOT = Path(__file__).parent
 OUTPUT_DIR = PROJECT_ROOT / "output"
 MASTER_CSV = OUTPUT_DIR / "master_dataset.csv"
-CLUSTERS_JSON = OUTPUT_DIR / "clusters.json"
+CLUSTERS_JSON = OUTPUT_DIR / "clusters.json"  # Optional legacy export (--json)
+CLUSTERS_ARTIFACT = OUTPUT_DIR / "clusters"  # Binary artifact: centers/labels .npy + meta.json
 VISUALIZATIONS_DIR = OUTPUT_DIR / "visualizations"
+EMBEDDING_STORE_DIR = OUTPUT_DIR / "embedding_store"  # Local float32 memmap snapshot of image_embeddings
 
 # === BROWSER (Scrapers) ===
 CHROME_DEBUG_PORT = 9222
@@ -27,9 +30,20 @@ DUPLICATE_STOP_THRESHOLD = 0.76
 CLIP_MODEL = "ViT-L-14"
 CLIP_PRETRAINED = "laion2b_s32b_b82k"
 EMBED_DIM = 768
+INFERENCE_BACKEND = os.environ.get("INFERENCE_BACKEND", "fp32")  # fp32 | bf16 | int8 | compile | onnx (pick per deployment from bench_backends report)
+ONNX_CACHE_DIR = OUTPUT_DIR / "onnx"  # Exported CLIP towers for INFERENCE_BACKEND=onnx
 EMBED_BATCH_SIZE = 64
 MAX_CONCURRENT_DOWNLOADS = 16
 DOWNLOAD_TIMEOUT = 30
+EMBED_DECODE_WORKERS = 4  # Decode + preprocess processes (draft JPEG decode into shared-memory slots)
+EMBED_UPLOAD_WORKERS = 2  # Concurrent bulk_upsert calls (also bounds Supabase write rate)
+EMBED_QUEUE_BATCHES = 2  # Bounded queue depth between stages, in batches (caps in-flight memory)
+EMBED_CHECKPOINT = OUTPUT_DIR / "embed_checkpoint.json"  # Byte offset into MASTER_CSV below which every row is finished
+EMBED_LEDGER = OUTPUT_DIR / "embedded_hashes.txt"  # Append-only content_hash ledger written per committed upsert chunk (--resume)
+COMPONENT_STORE_DIR = OUTPUT_DIR / "component_embeddings"  # Pre-fusion CLIP image vectors per content_hash (append-only shards)
+IMAGE_CACHE_DIR = OUTPUT_DIR / "image_cache"  # Shared content-addressed cache of downsized image bytes (all downloaders)
+IMAGE_CACHE_MAX_GB = 20  # LRU-evicted above this
+IMAGE_CACHE_MAX_SIDE = 512  # Shortest side kept; >= CLIP (224) and Q-Align (448) input sizes
 def get_text_weight(title: str, alt_text: str) -> float: # Dynamic weight
     if title and alt_text: return 0.30
     if alt_text or title: return 0.15
@@ -39,6 +53,12 @@ def get_text_weight(title: str, alt_text: str) -> float: # Dynamic weight
 DEFAULT_K = 120
 K_CANDIDATES = [80, 120, 160]
 CLUSTER_REPRESENTATIVES = 5
+MINIBATCH_SIZE = 4096  # Points per incremental center update (clustering.incremental_kmeans)
+RECLUSTER_DRIFT = 0.10  # Full refit once mean squared distance to centers exceeds the last full fit's by this fraction
+RECLUSTER_MAX_NEW_FRACTION = 0.25  # ...or once points added since the last full fit exceed this fraction of it
+SWEEP_WORKERS = max(1, min(4, (os.cpu_count() or 1) // 2))  # K candidates fitted in parallel by clustering.compare_k (BLAS threads split between them)
+SILHOUETTE_SAMPLE = 10000  # Points in the silhouette sample; its pairwise distances are computed once per sweep
+ASSIGN_FLUSH_ROWS = 1024  # Nearest-center labels buffered before cluster sizes in the artifact are bumped (served /clusters reloads on change)
 
 # === Q-ALIGN (VLM) ===
 QALIGN_MODEL = "q-future/one-align"
@@ -65,6 +85,31 @@ MIN_IMAGES_PER_CLUSTER = 3
 
 # === SUPABASE ===
 SUPABASE_TABLE = "image_embeddings"
+BULK_UPSERT_CHUNK = 500  # Rows per PostgREST upsert request (halved on errors, grown back after a run of successes)
+BULK_UPSERT_MIN_CHUNK = 10  # Below this a failing chunk is retried, not split further
+BULK_UPSERT_WORKERS = 4  # Concurrent requests / Postgres connections
+BULK_COPY_CHUNK = 5000  # Rows per COPY → staging → merge transaction when SUPABASE_DB_URL is set
+CLUSTER_UPDATE_CHUNK = 5000  # (content_hash, cluster_id) pairs per set_cluster_ids RPC / staging UPDATE
+STREAM_PAGE = 1000  # Rows per keyset page (PostgREST max-rows may cap it lower; pagination doesn't depend on it)
+STREAM_PARTITIONS = 16  # content_hash (md5 hex) prefix ranges paged independently
+STREAM_WORKERS = 4  # Partitions fetched concurrently
+STREAM_PREFETCH = 2  # Pages buffered per worker ahead of the consumer
+
+# === API SEARCH (in-process ANN) ===
+ANN_NLIST = 256  # IVF coarse cells (~sqrt(N) for 80k rows)
+ANN_NPROBE = 16  # Cells scanned per query (recall vs latency)
+ANN_REFRESH_SECONDS = 600  # Re-sync snapshot and hot-swap the index this often (0 = build once)
+TEXT_CACHE_SIZE = 4096  # Query-text embeddings kept in the API's LRU
+TEXT_CACHE_PATH = OUTPUT_DIR / "text_embedding_cache.npz"  # Persisted across restarts (None = memory only)
+INFER_MAX_BATCH = 32  # Max queries coalesced into one forward pass
+INFER_BATCH_WINDOW_MS = 5  # How long the first query waits for company
+INFER_WORKERS = 2  # Concurrent forward passes; torch intra-op threads = cores // INFER_WORKERS
+DECODE_WORKERS = 4  # PIL decode/resize pool for image queries (PIL releases the GIL while decoding)
+IMAGE_FETCH_CONCURRENCY = 64  # App-lifetime aiohttp connection pool size
+IMAGE_FETCH_TIMEOUT = 15
+IMAGE_FETCH_MAX_REDIRECTS = 3  # /search/image URLs: each hop is re-checked against the public-address rule
+MAX_UPLOAD_BYTES = 20 * 1024 * 1024
+CLUSTERS_WATCH_SECONDS = 2  # Poll interval for cluster artifact hot reload
 
 # === CSV COLUMNS ===
 CSV_COLUMNS = ["url", "pin_url", "category", "category_type", "search_term", "title", "alt_text", "saves", "comments", "engagement_score", "content_hash", "collected_at", "source"]
@@ -0,0 +1,139 @@
+import os, sys, threading, time # Bulk writes: concurrent large upserts / cluster_id updates with adaptive chunk sizing (PostgREST, or COPY → staging → merge with a DSN)
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+import numpy as np
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from settings import SUPABASE_TABLE, EMBED_DIM, BULK_UPSERT_CHUNK, BULK_UPSERT_MIN_CHUNK, BULK_UPSERT_WORKERS, BULK_COPY_CHUNK, CLUSTER_UPDATE_CHUNK
+from vector_db.supabase_client import get_client, batch_update_clusters  # Also loads .env (SUPABASE_DB_URL)
+
+RETRIES = 3  # Attempts for a chunk that can't be split further
+GROW_AFTER = 8  # Consecutive successful chunks before the chunk size doubles back toward its max
+_VEC_FMT = "[" + ",".join(["%.7g"] * EMBED_DIM) + "]"  # float32 round-trips in 7-9 significant digits; ~half the bytes of JSON float repr
+
+def pack_vector(v) -> str:  # pgvector text literal; accepted by PostgREST (JSON string) and COPY text format alike
+    if isinstance(v, str): return v
+    v = np.asarray(v, dtype=np.float32)
+    return _VEC_FMT % tuple(v.tolist()) if len(v) == EMBED_DIM else "[" + ",".join("%.7g" % x for x in v.tolist()) + "]"
+
+def _packed(chunk: list[dict]) -> list[dict]:
+    return [{**r, "embedding": pack_vector(r["embedding"])} if r.get("embedding") is not None else r for r in chunk]
+
+class _ChunkSizer:  # Shared across calls: shrinks on failures so later chunks don't repeat a too-large request, grows back on sustained success
+    def __init__(self, size: int, min_size: int):
+        self.max_size, self.min_size, self.size, self._streak = size, min_size, size, 0
+        self._lock = threading.Lock()
+    def failed(self, n: int):
+        with self._lock: self.size, self._streak = max(self.min_size, min(self.size, n // 2)), 0
+    def succeeded(self):
+        with self._lock:
+            self._streak += 1
+            if self._streak >= GROW_AFTER and self.size < self.max_size: self.size, self._streak = min(self.max_size, self.size * 2), 0
+
+_rest_sizer = _ChunkSizer(BULK_UPSERT_CHUNK, BULK_UPSERT_MIN_CHUNK)
+_copy_sizer = _ChunkSizer(BULK_COPY_CHUNK, BULK_UPSERT_MIN_CHUNK)
+_cluster_sizer = _ChunkSizer(CLUSTER_UPDATE_CHUNK, BULK_UPSERT_MIN_CHUNK)
+_rpc_ok: Optional[bool] = None
+_pool = ThreadPoolExecutor(BULK_UPSERT_WORKERS, thread_name_prefix="bulk-upsert")
+_local = threading.local()  # One Postgres connection per pool thread, reused across calls
+
+def _rest_send(chunk: list[dict]):
+    from postgrest.types import ReturnMethod
+    get_client().table(SUPABASE_TABLE).upsert(_packed(chunk), returning=ReturnMethod.minimal).execute()  # return=minimal: don't echo 768-d vectors back
+
+def _pg_conn():
+    conn = getattr(_local, "conn", None)
+    if conn is None or conn.closed:
+        import psycopg
+        conn = _local.conn = psycopg.connect(os.environ["SUPABASE_DB_URL"], prepare_threshold=None)  # No server-side prepares: safe behind the Supabase transaction pooler
+    return conn
+
+def _copy_send(chunk: list[dict]):  # One transaction: COPY into a session temp table, then a set-based merge (a failed chunk leaves nothing behind)
+    cols = list(chunk[0])
+    updates = ", ".join(f"{c} = EXCLUDED.{c}" for c in cols if c != "content_hash")
+    conn = _pg_conn()
+    try:
+        with conn.transaction(), conn.cursor() as cur:
+            cur.execute(f"CREATE TEMP TABLE IF NOT EXISTS _bulk_staging (LIKE {SUPABASE_TABLE} INCLUDING DEFAULTS)")
+            cur.execute("TRUNCATE _bulk_staging")
+            with cur.copy(f"COPY _bulk_staging ({', '.join(cols)}) FROM STDIN") as copy:
+                for r in chunk: copy.write_row([pack_vector(r[c]) if c == "embedding" and r[c] is not None else r[c] for c in cols])
+            cur.execute(f"INSERT INTO {SUPABASE_TABLE} ({', '.join(cols)}) SELECT DISTINCT ON (content_hash) {', '.join(cols)} FROM _bulk_staging "
+                        f"ON CONFLICT (content_hash) DO UPDATE SET {updates}")
+    except Exception:
+        if conn.broken: _local.conn = None
+        raise
+
+def _send_adaptive(send: Callable, sizer: _ChunkSizer, chunk: list, on_chunk: Optional[Callable[[list], None]]) -> int:
+    """Send one chunk; on error split it in halves and recurse, so only the failed rows are resent. Chunks at the minimum size are retried with backoff.
+    on_chunk runs once per committed chunk, outside the retry: its own errors propagate instead of re-sending rows that are already in."""
+    for attempt in range(RETRIES if len(chunk) <= sizer.min_size else 1):
+        try:
+            send(chunk)
+        except Exception as e:
+            err = e
+            if len(chunk) <= sizer.min_size: time.sleep(0.5 * 2 ** attempt)
+            continue
+        sizer.succeeded()
+        if on_chunk: on_chunk(chunk)
+        return len(chunk)
+    sizer.failed(len(chunk))
+    if len(chunk) <= sizer.min_size:
+        print(f"⚠️ {len(chunk)} rows failed after {RETRIES} attempts: {err}")
+        return 0
+    mid = len(chunk) // 2
+    return _send_adaptive(send, sizer, chunk[:mid], on_chunk) + _send_adaptive(send, sizer, chunk[mid:], on_chunk)
+
+def copy_available() -> bool:  # COPY path needs a direct Postgres DSN and the optional psycopg (v3) driver
+    if not os.environ.get("SUPABASE_DB_URL"): return False
+    try: import psycopg
+    except ImportError: return False
+    return True
+
+def bulk_upsert(records: list[dict], on_chunk: Optional[Callable[[list[dict]], None]] = None, use_copy: Optional[bool] = None) -> int:
+    """Upsert records concurrently in large chunks; returns rows committed. on_chunk sees each committed chunk (possibly from a pool thread)."""
+    if not records: return 0
+    use_copy = copy_available() if use_copy is None else use_copy
+    send, sizer = (_copy_send, _copy_sizer) if use_copy else (_rest_send, _rest_sizer)
+    size = sizer.size
+    chunks = [records[i:i + size] for i in range(0, len(records), size)]
+    return sum(_pool.map(lambda c: _send_adaptive(send, sizer, c, on_chunk), chunks))
+
+def _rpc_cluster_send(chunk: list[tuple[str, int]]):  # set_cluster_ids RPC (SETUP_SQL): one UPDATE ... FROM unnest(arrays) per chunk
+    get_client().rpc("set_cluster_ids", {"hashes": [h for h, _ in chunk], "ids": [c for _, c in chunk]}).execute()
+
+def _copy_cluster_send(chunk: list[tuple[str, int]]):
+    conn = _pg_conn()
+    try:
+        with conn.transaction(), conn.cursor() as cur:
+            cur.execute("CREATE TEMP TABLE IF NOT EXISTS _cluster_staging (content_hash TEXT PRIMARY KEY, cluster_id INTEGER)")
+            cur.execute("TRUNCATE _cluster_staging")
+            with cur.copy("COPY _cluster_staging (content_hash, cluster_id) FROM STDIN") as copy:
+                for row in chunk: copy.write_row(row)
+            cur.execute(f"UPDATE {SUPABASE_TABLE} ie SET cluster_id = s.cluster_id FROM _cluster_staging s "
+                        "WHERE ie.content_hash = s.content_hash AND ie.cluster_id IS DISTINCT FROM s.cluster_id")
+    except Exception:
+        if conn.broken: _local.conn = None
+        raise
+
+def _rpc_available() -> bool:  # Probe once with empty arrays; PGRST202 = function not created yet (SETUP_SQL not re-run)
+    global _rpc_ok
+    if _rpc_ok is None:
+        try:
+            get_client().rpc("set_cluster_ids", {"hashes": [], "ids": []}).execute()
+            _rpc_ok = True
+        except Exception as e:
+            _rpc_ok = "PGRST202" not in str(e) and "set_cluster_ids" not in str(e)
+    return _rpc_ok
+
+def bulk_update_clusters(updates: list[tuple[str, int]], use_copy: Optional[bool] = None) -> int:
+    """Set cluster_id for (content_hash, cluster_id) pairs in large concurrent chunks; rows already holding the label are not rewritten server-side."""
+    if not updates: return 0
+    use_copy = copy_available() if use_copy is None else use_copy
+    if not use_copy and not _rpc_available():
+        print("⚠️ set_cluster_ids RPC missing (re-run SETUP_SQL); falling back to one UPDATE per row")
+        return batch_update_clusters(updates)
+    send = _copy_cluster_send if use_copy else _rpc_cluster_send
+    size = _cluster_sizer.size
+    chunks = [updates[i:i + size] for i in range(0, len(updates), size)]
+    return sum(_pool.map(lambda c: _send_adaptive(send, _cluster_sizer, c, None), chunks))
@@ -0,0 +1,180 @@
+import json, os, sys # Local columnar snapshot of image_embeddings: float32 .npy memmap + metadata sidecar
+import numpy as np
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from settings import EMBEDDING_STORE_DIR, EMBED_DIM, SUPABASE_TABLE
+from vector_db.table_stream import iter_blocks, block_rows
+
+META_COLUMNS = ["content_hash", "image_url", "category", "category_type", "source", "created_at", "updated_at", "cluster_id", "qalign_aesthetic"]
+ATTR_COLUMNS = ["cluster_id", "qalign_aesthetic"]  # Mutable after insert (re-cluster / scoring); refreshed without re-pulling embeddings
+HASH_IN_CHUNK = 200  # content_hash values per .in_() filter (keeps URL length sane)
+
+def parse_embedding(emb) -> list[float]:  # pgvector comes back from PostgREST as "[0.1,0.2,...]" string
+    return json.loads(emb) if isinstance(emb, str) else emb
+
+class LocalEmbeddingStore:
+    """Row i of embeddings.npy belongs to meta["columns"][*][i]; both files are replaced atomically on sync."""
+    def __init__(self, root: Path = EMBEDDING_STORE_DIR):
+        self.root = Path(root)
+        self.matrix_path = self.root / "embeddings.npy"
+        self.meta_path = self.root / "meta.json"
+        self._meta = None
+
+    def exists(self) -> bool:
+        return self.matrix_path.exists() and self.meta_path.exists()
+
+    def meta(self) -> dict:  # {"columns": {col: [...]}, "watermark": max updated_at, "count": n, "version": matrix rewrites}
+        if self._meta is None:
+            if self.exists():
+                with open(self.meta_path) as f: self._meta = json.load(f)
+            else: self._meta = {"columns": {c: [] for c in META_COLUMNS}, "watermark": None, "count": 0}
+            for c in META_COLUMNS: self._meta["columns"].setdefault(c, [None] * self._meta["count"])  # Snapshots from before a column existed
+        return self._meta
+
+    def __len__(self) -> int:
+        return self.meta()["count"]
+
+    def version(self) -> int:  # Bumped on every embeddings.npy rewrite (appends, in-place vector updates); attribute-only writes keep it
+        return self.meta().get("version", 0)
+
+    def hashes(self) -> list[str]:
+        return self.meta()["columns"]["content_hash"]
+
+    def embeddings(self) -> np.ndarray:  # Zero-copy read-only view, pages in lazily
+        if not self.exists(): return np.empty((0, EMBED_DIM), dtype=np.float32)
+        return np.load(self.matrix_path, mmap_mode="r")
+
+    def rows(self) -> list[dict]:  # Row dicts (no embedding) for plotting / representatives
+        cols = self.meta()["columns"]
+        return [dict(zip(META_COLUMNS, vals)) for vals in zip(*(cols[c] for c in META_COLUMNS))]
+
+    def replace_embeddings(self, hashes: list[str], embs: np.ndarray) -> int:  # Overwrite vectors for known hashes (offline re-fusion); metadata + watermark unchanged
+        meta = self.meta()
+        pos = {h: i for i, h in enumerate(meta["columns"]["content_hash"])}
+        updates = {pos[h]: embs[j] for j, h in enumerate(hashes) if h in pos}
+        self._write(meta["columns"], self.embeddings(), updates, np.empty((0, EMBED_DIM), dtype=np.float32), meta["watermark"])
+        return len(updates)
+
+    def set_attribute(self, column: str, values: dict[str, object]) -> int:  # Record values just written upstream (e.g. cluster_id after write-back); rewrites only the sidecar
+        meta = self.meta()
+        if not self.exists() or not values: return 0
+        col, changed = meta["columns"][column], 0
+        for i, h in enumerate(meta["columns"]["content_hash"]):
+            if h in values and col[i] != values[h]:
+                col[i] = values[h]
+                changed += 1
+        if changed: self._write_meta(meta)
+        return changed
+
+    def _write_meta(self, meta: dict):  # Sidecar only (attributes / watermark moved, vectors untouched): version stays, so the ANN index just rebinds
+        tmp_meta = self.meta_path.with_suffix(".tmp.json")
+        with open(tmp_meta, "w") as f: json.dump(meta, f)
+        os.replace(tmp_meta, self.meta_path)
+        self._meta = meta
+
+    def _write(self, columns: dict, old_rows: np.ndarray, updates: dict[int, np.ndarray], new_embs: np.ndarray, watermark: str | None):  # Rewrite matrix + sidecar via tmp files and os.replace
+        self.root.mkdir(parents=True, exist_ok=True)
+        n_old, n_new = len(old_rows), len(new_embs)
+        tmp_matrix = self.matrix_path.with_suffix(".tmp.npy")
+        out = np.lib.format.open_memmap(tmp_matrix, mode="w+", dtype=np.float32, shape=(n_old + n_new, EMBED_DIM))
+        for i in range(0, n_old, 65536): out[i:min(i + 65536, n_old)] = old_rows[i:i + 65536]  # Chunked copy keeps RSS flat
+        for idx, emb in updates.items(): out[idx] = emb
+        if n_new: out[n_old:] = new_embs
+        out.flush(); del out
+        meta = {"columns": columns, "watermark": watermark, "count": n_old + n_new, "version": self.version() + 1}
+        tmp_meta = self.meta_path.with_suffix(".tmp.json")
+        with open(tmp_meta, "w") as f: json.dump(meta, f)
+        os.replace(tmp_matrix, self.matrix_path)
+        os.replace(tmp_meta, self.meta_path)
+        self._meta = meta
+
+    def _merge(self, fetched: list[dict], keep: np.ndarray | None = None) -> tuple[int, int]:  # Apply fetched rows: overwrite known hashes in place, append the rest
+        columns = {c: list(v) for c, v in self.meta()["columns"].items()}
+        old = self.embeddings()
+        if keep is not None:  # Drop rows deleted upstream
+            old = old[keep]
+            columns = {c: [v for v, k in zip(vals, keep) if k] for c, vals in columns.items()}
+        pos = {h: i for i, h in enumerate(columns["content_hash"])}
+        updates, new_embs, watermark, touched = {}, [], self.meta()["watermark"], 0
+        for r in fetched:
+            emb = np.asarray(parse_embedding(r["embedding"]), dtype=np.float32)
+            i = pos.get(r["content_hash"])
+            if i is None:
+                pos[r["content_hash"]] = len(columns["content_hash"])
+                for c in META_COLUMNS: columns[c].append(r.get(c))
+                new_embs.append(emb)
+            else:
+                for c in META_COLUMNS: columns[c][i] = r.get(c)
+                touched += 1
+                if not np.array_equal(old[i], emb): updates[i] = emb  # Metadata-only changes leave the matrix (and its version) alone
+            stamp = r.get("updated_at") or r.get("created_at")  # created_at only for tables without the updated_at trigger
+            if stamp and (watermark is None or stamp > watermark): watermark = stamp
+        if not new_embs and not updates and keep is None:
+            self._write_meta({**self.meta(), "columns": columns, "watermark": watermark})
+            return 0, touched
+        new_embs = np.stack(new_embs) if new_embs else np.empty((0, EMBED_DIM), dtype=np.float32)
+        self._write(columns, old, updates, new_embs, watermark)
+        return len(new_embs), touched
+
+    def _changed_rows(self, watermark: str | None) -> tuple[list[dict], list[str]]:  # (rows inserted or updated since watermark, columns selected)
+        columns = META_COLUMNS + ["embedding"]
+        try:  # gte: rows stamped in the same instant as the watermark row are not skipped; re-fetched unchanged rows are filtered out below
+            fetched = [r for block in iter_blocks(columns, [("gte", "updated_at", watermark)] if watermark else []) for r in block_rows(block)]
+        except Exception as e:
+            if "updated_at" not in str(e): raise
+            print("   ⚠️ image_embeddings.updated_at missing (re-run SETUP_SQL); syncing new rows only, updates to existing rows are not picked up")
+            columns = [c for c in columns if c != "updated_at"]
+            return [r for block in iter_blocks(columns, [("gt", "created_at", watermark)] if watermark else []) for r in block_rows(block)], columns
+        local = dict(zip(self.hashes(), self.meta()["columns"]["updated_at"]))
+        return [r for r in fetched if r["content_hash"] not in local or local[r["content_hash"]] != r.get("updated_at")], columns
+
+    def sync(self, reconcile: bool = False) -> int:  # Pull rows inserted or updated after the watermark; reconcile=True also diffs content_hash sets
+        from vector_db.supabase_client import get_client
+        watermark = self.meta()["watermark"]
+        print(f"🔄 Syncing local embedding store ({len(self)} rows, watermark={watermark})...")
+        fetched, columns = self._changed_rows(watermark)
+        keep = None
+        if reconcile:  # Hash-only diff catches rows the watermark missed (backfilled timestamps) and deletions
+            remote = {h for block in iter_blocks(["content_hash"]) for h in block["content_hash"]}
+            local = self.hashes()
+            keep = np.array([h in remote for h in local], dtype=bool)
+            have = set(local) | {r["content_hash"] for r in fetched}
+            missing = sorted(remote - have)
+            for i in range(0, len(missing), HASH_IN_CHUNK):
+                fetched.extend(get_client().table(SUPABASE_TABLE).select(",".join(columns)).in_("content_hash", missing[i:i + HASH_IN_CHUNK]).execute().data or [])
+            if keep.all(): keep = None
+        if not fetched and keep is None:
+            print("   ✅ Already up to date")
+            return 0
+        added, updated = self._merge(fetched, keep)
+        print(f"   ✅ +{added} new, {updated} updated, {len(self)} total")
+        return added
+
+    def refresh_attributes(self) -> int:  # Pull cluster_id / qalign_aesthetic for every row; rewrites only the sidecar
+        if not self.exists(): return 0
+        remote = {r["content_hash"]: r for block in iter_blocks(["content_hash"] + ATTR_COLUMNS) for r in block_rows(block)}
+        meta = self.meta()
+        cols, changed = meta["columns"], 0
+        for i, h in enumerate(cols["content_hash"]):
+            r = remote.get(h)
+            if r is None: continue
+            for c in ATTR_COLUMNS:
+                if cols[c][i] != r.get(c):
+                    cols[c][i] = r.get(c)
+                    changed += 1
+        if changed: self._write_meta(meta)
+        print(f"   ✅ {changed} attribute values changed")
+        return changed
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description="Sync local embedding snapshot from Supabase")
+    parser.add_argument("--reconcile", action="store_true", help="Also diff content_hash sets (catches backfills and deletions)")
+    parser.add_argument("--attributes", action="store_true", help=f"Also refresh mutable columns: {', '.join(ATTR_COLUMNS)}")
+    args = parser.parse_args()
+    store = LocalEmbeddingStore()
+    store.sync(reconcile=args.reconcile)
+    if args.attributes: store.refresh_attributes()
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,6 @@
 import os, json # Supabase pgvector client for embedding storage
 from pathlib import Path
-from typing import Optional
+from typing import Callable, Optional
 from dotenv import load_dotenv
 from supabase import create_client, Client
 
@@ -28,7 +28,7 @@ def upsert_embedding(content_hash: str, image_url: str, category: str, category_
         print(f"⚠️ Supabase upsert failed: {e}")
         return False
 
-def upsert_batch(records: list[dict], chunk_size: int = 10) -> int:  # Batch upsert with chunking for SSL stability
+def upsert_batch(records: list[dict], chunk_size: int = 10, on_chunk: Optional[Callable[[list[dict]], None]] = None) -> int:  # Batch upsert with chunking for SSL stability; on_chunk sees each committed chunk
     success = 0
     for i in range(0, len(records), chunk_size):
         chunk = records[i:i + chunk_size]
@@ -36,25 +36,30 @@ def upsert_batch(records: list[dict], chunk_size: int = 10) -> int:  # Batch ups
             try:
                 get_client().table("image_embeddings").upsert(chunk).execute()
                 success += len(chunk)
+                if on_chunk: on_chunk(chunk)
                 break
             except Exception as e:
                 if attempt == 2: print(f"⚠️ Chunk {i//chunk_size} failed after 3 attempts: {e}")
                 import time; time.sleep(1)  # Brief pause before retry
     return success
 
-def search_similar(embedding: list[float], limit: int = 20) -> list[dict]:  # KNN search using pgvector
-    result = get_client().rpc("match_embeddings", {"query_embedding": embedding, "match_count": limit}).execute()
+def _as_list(v): return None if v is None else list(v) if isinstance(v, (list, tuple, set)) else [v]
+
+def search_similar(embedding: list[float], limit: int = 20, filters: dict | None = None) -> list[dict]:  # KNN search using pgvector (filters evaluated in SQL)
+    params = {"query_embedding": embedding, "match_count": limit}
+    if filters:  # Only send filter args when used, so the 2-arg RPC keeps working on un-migrated databases
+        params.update({"filter_category": _as_list(filters.get("category")), "filter_category_type": _as_list(filters.get("category_type")), "filter_source": _as_list(filters.get("source")), "filter_cluster_id": _as_list(filters.get("cluster_id")), "min_aesthetic": filters.get("min_aesthetic")})
+    result = get_client().rpc("match_embeddings", params).execute()
     return result.data if result.data else []
 
-def get_all_embeddings(batch_size: int = 1000) -> list[dict]:  # Fetch all embeddings for clustering (paginated)
-    all_data, offset = [], 0
-    while True:
-        result = get_client().table("image_embeddings").select("content_hash,embedding,category,category_type,image_url").range(offset, offset + batch_size - 1).execute()
-        if not result.data: break
-        all_data.extend(result.data)
-        if len(result.data) < batch_size: break
-        offset += batch_size
-    return all_data
+def get_all_embeddings(batch_size: int = 1000) -> list[dict]:  # Fetch all embeddings for clustering (streamed keyset pages; embedding as list)
+    from vector_db.table_stream import fetch_rows
+    rows = fetch_rows(["content_hash", "embedding", "category", "category_type", "image_url"], page_size=batch_size)
+    return [{**r, "embedding": r["embedding"].tolist()} for r in rows]
+
+def get_all_content_hashes(batch_size: int = 1000) -> set[str]:  # Hashes only, keyset-paginated on the primary key (no OFFSET rescans, no vectors)
+    from vector_db.table_stream import iter_blocks
+    return {h for block in iter_blocks(["content_hash"], page_size=batch_size) for h in block["content_hash"]}
 
 def update_cluster_id(content_hash: str, cluster_id: int) -> bool:  # Update cluster assignment
     try:
@@ -62,7 +67,7 @@ def update_cluster_id(content_hash: str, cluster_id: int) -> bool:  # Update clu
         return True
     except: return False
 
-def batch_update_clusters(updates: list[tuple[str, int]]) -> int:  # Batch update cluster IDs
+def batch_update_clusters(updates: list[tuple[str, int]]) -> int:  # One UPDATE per row (fallback when set_cluster_ids isn't installed; see bulk_upsert.bulk_update_clusters)
     success = 0
     for content_hash, cluster_id in updates:
         if update_cluster_id(content_hash, cluster_id): success += 1
@@ -87,7 +92,8 @@ CREATE TABLE IF NOT EXISTS image_embeddings (
     source TEXT DEFAULT 'pinterest',       -- pinterest, behance, dribbble, adsoftheworld
     qalign_aesthetic FLOAT,                 -- Q-Align aesthetic score (0-5)
     qalign_quality FLOAT,                   -- Q-Align quality score (0-5)
-    created_at TIMESTAMPTZ DEFAULT NOW()
+    created_at TIMESTAMPTZ DEFAULT NOW(),
+    updated_at TIMESTAMPTZ DEFAULT NOW()   -- Bumped by trigger when the embedding or mirrored metadata changes (local_store sync watermark)
 );
 
 -- Add source column if table exists (migration)
@@ -95,12 +101,34 @@ CREATE TABLE IF NOT EXISTS image_embeddings (
 -- ALTER TABLE image_embeddings ADD COLUMN IF NOT EXISTS qalign_aesthetic FLOAT;
 -- ALTER TABLE image_embeddings ADD COLUMN IF NOT EXISTS qalign_quality FLOAT;
 
+-- updated_at follows changes to the embedding and the metadata local_store mirrors (re-upserts, re-fusion). Attribute columns
+-- (cluster_id write-back, Q-Align scores) don't bump it: local_store.refresh_attributes pulls those without re-downloading vectors
+ALTER TABLE image_embeddings ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ DEFAULT NOW();
+CREATE OR REPLACE FUNCTION touch_updated_at() RETURNS TRIGGER
+LANGUAGE plpgsql AS $$
+BEGIN
+    IF (NEW.embedding, NEW.image_url, NEW.category, NEW.category_type, NEW.source)
+       IS DISTINCT FROM (OLD.embedding, OLD.image_url, OLD.category, OLD.category_type, OLD.source) THEN
+        NEW.updated_at = clock_timestamp();
+    END IF;
+    RETURN NEW;
+END;
+$$;
+DROP TRIGGER IF EXISTS image_embeddings_touch ON image_embeddings;
+CREATE TRIGGER image_embeddings_touch BEFORE UPDATE ON image_embeddings FOR EACH ROW EXECUTE FUNCTION touch_updated_at();
+CREATE INDEX IF NOT EXISTS image_embeddings_updated_idx ON image_embeddings (updated_at);
+
 -- Create vector index for similarity search
 CREATE INDEX IF NOT EXISTS image_embeddings_embedding_idx 
 ON image_embeddings USING ivfflat (embedding vector_cosine_ops) WITH (lists = 100);
 
--- Create function for similarity search
-CREATE OR REPLACE FUNCTION match_embeddings(query_embedding VECTOR(768), match_count INT)
+-- Create function for similarity search (NULL filter = no constraint)
+-- pgvector >= 0.8: SET ivfflat.iterative_scan = relaxed_order so selective filters still return match_count rows
+-- Drop the old 2-argument version first: CREATE OR REPLACE with a new signature adds an overload, and PostgREST rejects the ambiguous call (PGRST203)
+DROP FUNCTION IF EXISTS match_embeddings(vector, int);
+CREATE OR REPLACE FUNCTION match_embeddings(query_embedding VECTOR(768), match_count INT,
+    filter_category TEXT[] DEFAULT NULL, filter_category_type TEXT[] DEFAULT NULL, filter_source TEXT[] DEFAULT NULL,
+    filter_cluster_id INT[] DEFAULT NULL, min_aesthetic FLOAT DEFAULT NULL)
 RETURNS TABLE (content_hash TEXT, image_url TEXT, category TEXT, category_type TEXT, similarity FLOAT)
 LANGUAGE plpgsql AS $$
 BEGIN
@@ -108,9 +136,32 @@ BEGIN
     SELECT ie.content_hash, ie.image_url, ie.category, ie.category_type,
            1 - (ie.embedding <=> query_embedding) AS similarity
     FROM image_embeddings ie
+    WHERE (filter_category IS NULL OR ie.category = ANY(filter_category))
+      AND (filter_category_type IS NULL OR ie.category_type = ANY(filter_category_type))
+      AND (filter_source IS NULL OR ie.source = ANY(filter_source))
+      AND (filter_cluster_id IS NULL OR ie.cluster_id = ANY(filter_cluster_id))
+      AND (min_aesthetic IS NULL OR ie.qalign_aesthetic >= min_aesthetic)
     ORDER BY ie.embedding <=> query_embedding
     LIMIT match_count;
 END;
 $$;
+
+-- Set-based cluster_id write-back: one UPDATE per call, rows whose label is unchanged are skipped (no dead tuples / WAL)
+CREATE OR REPLACE FUNCTION set_cluster_ids(hashes TEXT[], ids INT[])
+RETURNS INTEGER
+LANGUAGE plpgsql AS $$
+DECLARE n INTEGER;
+BEGIN
+    UPDATE image_embeddings ie SET cluster_id = u.cluster_id
+    FROM unnest(hashes, ids) AS u(content_hash, cluster_id)
+    WHERE ie.content_hash = u.content_hash AND ie.cluster_id IS DISTINCT FROM u.cluster_id;
+    GET DIAGNOSTICS n = ROW_COUNT;
+    RETURN n;
+END;
+$$;
+
+-- Partial-selectivity helpers for the filtered path
+CREATE INDEX IF NOT EXISTS image_embeddings_category_idx ON image_embeddings (category);
+CREATE INDEX IF NOT EXISTS image_embeddings_cluster_idx ON image_embeddings (cluster_id);
 """
 
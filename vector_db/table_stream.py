@@ -0,0 +1,113 @@
+import json, queue, sys, threading, time # Streaming reader for image_embeddings: keyset pages over content_hash partitions, fetched concurrently, yielded as NumPy column blocks
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator, Optional
+import numpy as np
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from settings import SUPABASE_TABLE, EMBED_DIM, STREAM_PAGE, STREAM_PARTITIONS, STREAM_WORKERS, STREAM_PREFETCH
+
+VECTOR_COLUMNS = {"embedding"}  # Parsed into (n, EMBED_DIM) float32; every other column is a 1-D object array
+_DONE = object()
+
+def partition_bounds(n: int) -> list[tuple[Optional[str], Optional[str]]]:  # [lo, hi) content_hash ranges on 2-hex-digit prefixes; open-ended at both ends so nothing falls outside
+    cuts = [f"{i * 256 // n:02x}" for i in range(1, n)]
+    return list(zip([None] + cuts, cuts + [None]))
+
+def _vectors(values: list) -> np.ndarray:  # One json.loads per page instead of per row ("[...]" strings from PostgREST)
+    if any(v is None for v in values):
+        return np.stack([np.full(EMBED_DIM, np.nan, np.float32) if v is None else np.asarray(json.loads(v) if isinstance(v, str) else v, np.float32) for v in values])
+    if isinstance(values[0], str): return np.asarray(json.loads("[" + ",".join(values) + "]"), dtype=np.float32)
+    return np.asarray(values, dtype=np.float32)
+
+def to_block(rows: list[dict], columns: list[str]) -> dict[str, np.ndarray]:
+    block = {}
+    for c in columns:
+        values = [r.get(c) for r in rows]
+        if c in VECTOR_COLUMNS: block[c] = _vectors(values) if values else np.empty((0, EMBED_DIM), np.float32)
+        else:
+            block[c] = np.empty(len(values), dtype=object)
+            block[c][:] = values
+    return block
+
+def block_rows(block: dict[str, np.ndarray]) -> Iterator[dict]:  # Row dicts back out of a block (vectors stay ndarray rows)
+    cols = list(block)
+    for vals in zip(*(block[c] for c in cols)): yield dict(zip(cols, vals))
+
+def iter_blocks(columns: list[str], filters: list[tuple] = (), limit: int = None, page_size: int = STREAM_PAGE, partitions: int = STREAM_PARTITIONS,
+                workers: int = STREAM_WORKERS, prefetch: int = STREAM_PREFETCH, table: str = SUPABASE_TABLE) -> Iterator[dict[str, np.ndarray]]:
+    """Yield {column: array} blocks (one per page) for rows matching filters, e.g. [("gt", "created_at", wm), ("is_", "cluster_id", "null")].
+    Only `columns` (+ content_hash, the keyset) are selected. Each partition is paged with content_hash > last seen, so every page is an index range scan;
+    blocks arrive in completion order, not globally sorted. With `limit`, partitions are consumed in key order instead and the result is truncated,
+    so a limited read returns the same (lowest content_hash) rows every run; fetching stops once `limit` rows have been yielded."""
+    from vector_db.supabase_client import get_client
+    columns = list(columns) if "content_hash" in columns else ["content_hash", *columns]
+    select = ",".join(columns)
+    bounds, stop = partition_bounds(partitions), threading.Event()
+    ordered = limit is not None
+    if ordered: queues = [queue.Queue(maxsize=max(1, prefetch)) for _ in bounds]  # One per partition: later partitions prefetch, then wait their turn
+    else: queues = [queue.Queue(maxsize=max(1, workers * prefetch))] * len(bounds)
+
+    def put(out: queue.Queue, item) -> bool:  # Blocks while the consumer is behind (bounded prefetch); gives up once it stopped
+        while not stop.is_set():
+            try:
+                out.put(item, timeout=0.5)
+                return True
+            except queue.Full: continue
+        return False
+
+    def fetch_partition(lo: Optional[str], hi: Optional[str], out: queue.Queue):
+        last = None
+        try:
+            while not stop.is_set():
+                q = get_client().table(table).select(select).order("content_hash").limit(page_size)
+                if last is not None: q = q.gt("content_hash", last)
+                elif lo is not None: q = q.gte("content_hash", lo)
+                if hi is not None: q = q.lt("content_hash", hi)
+                for op, col, val in filters: q = getattr(q, op)(col, val)
+                for attempt in range(3):  # Retry up to 3 times; the keyset makes a retried page idempotent
+                    try:
+                        rows = q.execute().data
+                        break
+                    except Exception:
+                        if attempt == 2: raise
+                        time.sleep(1)
+                if not rows: break
+                if not put(out, rows): return
+                last = rows[-1]["content_hash"]
+        except Exception as e:
+            put(out, e)
+            return
+        put(out, _DONE)
+
+    def pages() -> Iterator:  # Pages (or a partition's exception) in consumption order
+        if ordered:
+            for out in queues:
+                while (item := out.get()) is not _DONE: yield item
+            return
+        remaining = len(bounds)
+        while remaining:
+            item = queues[0].get()
+            if item is _DONE: remaining -= 1
+            else: yield item
+
+    pool = ThreadPoolExecutor(workers, thread_name_prefix="table-stream")
+    for (lo, hi), out in zip(bounds, queues): pool.submit(fetch_partition, lo, hi, out)  # FIFO: partitions start in key order
+    n = 0
+    try:
+        for item in pages():
+            if isinstance(item, Exception): raise item
+            if limit is not None: item = item[:limit - n]
+            n += len(item)
+            yield to_block(item, columns)
+            if limit is not None and n >= limit: return
+    finally:
+        stop.set()
+        pool.shutdown(wait=False, cancel_futures=True)
+
+def fetch_columns(columns: list[str], filters: list[tuple] = (), limit: int = None, **kwargs) -> dict[str, np.ndarray]:  # Whole result as one block
+    blocks = list(iter_blocks(columns, filters, limit, **kwargs))
+    if not blocks: return to_block([], list(columns) if "content_hash" in columns else ["content_hash", *columns])
+    return {c: np.concatenate([b[c] for b in blocks]) for c in blocks[0]}
+
+def fetch_rows(columns: list[str], filters: list[tuple] = (), limit: int = None, **kwargs) -> list[dict]:  # List-of-dicts for callers that batch / shuffle rows
+    return [row for block in iter_blocks(columns, filters, limit, **kwargs) for row in block_rows(block)]
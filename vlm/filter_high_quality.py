@@ -2,16 +2,16 @@ import json, sys # Filter high-quality images and select top-K per cluster
 from pathlib import Path
 from collections import defaultdict
 sys.path.insert(0, str(Path(__file__).parent.parent))
-from vlm.config_vlm import QALIGN_SCORES_JSON, CLUSTERS_JSON, TOP_K_PER_CLUSTER, QALIGN_MIN_SCORE, OUTPUT_DIR
+from vlm.config_vlm import QALIGN_SCORES_JSON, TOP_K_PER_CLUSTER, QALIGN_MIN_SCORE, OUTPUT_DIR
+from clustering.cluster_artifact import load_cluster_dicts
 
 def load_qalign_scores() -> dict[str, dict]: # Load Q-Align scores as hash -> score dict
     if not QALIGN_SCORES_JSON.exists(): raise FileNotFoundError(f"Run qalign_scorer.py first: {QALIGN_SCORES_JSON}")
     with open(QALIGN_SCORES_JSON) as f: data = json.load(f)
     return {r["content_hash"]: r for r in data if r.get("qalign_aesthetic") is not None}
 
-def load_clusters() -> list[dict]: # Load clusters.json
-    if not CLUSTERS_JSON.exists(): raise FileNotFoundError(f"clusters.json not found: {CLUSTERS_JSON}")
-    with open(CLUSTERS_JSON) as f: return json.load(f)
+def load_clusters() -> list[dict]: # Load cluster artifact (falls back to clusters.json)
+    return load_cluster_dicts()
 
 def filter_and_select_top_k(top_k: int = TOP_K_PER_CLUSTER, min_score: float = QALIGN_MIN_SCORE) -> dict:
     """Filter clusters to only include high-quality images, select top-K per cluster"""
@@ -9,12 +9,16 @@ import open_clip
 import numpy as np
 import warnings; warnings.filterwarnings("ignore")
 sys.path.insert(0, str(Path(__file__).parent.parent))
+from embedding.image_cache import get_image_cache
 
 AESTHETIC_MODEL_URL = "https://github.com/LAION-AI/aesthetic-predictor/raw/main/sa_0_4_vit_l_14_linear.pth"
 BATCH_SIZE = 64  # Much larger batch than Q-Align!
 DOWNLOAD_CONCURRENCY = 50
 CHECKPOINT_EVERY = 100
 SCORES_JSON = Path(__file__).parent.parent / "output" / "laion_aesthetic_scores.json"
+HEAD_PATH = Path(__file__).parent.parent / "output" / "laion_head_laion2b.npz"  # Ridge head: stored laion2b image embeddings → LAION (openai) score
+RIDGE_LAMBDAS = [0.01, 0.1, 1.0, 10.0, 100.0]
+MIN_CALIBRATION = 50  # Labelled images needed for an 80/20 split with a meaningful holdout
 
 class LAIONAestheticScorer:
     def __init__(self, device: str = "mps"):
@@ -43,48 +47,28 @@ class LAIONAestheticScorer:
         scores = self.aesthetic_mlp(embeddings).squeeze(-1).cpu().numpy()
         return [round(float(s), 3) for s in scores]
 
-async def download_image_async(session: aiohttp.ClientSession, url: str) -> tuple[str, Image.Image | None]:
-    try:
-        async with session.get(url, timeout=aiohttp.ClientTimeout(total=8)) as resp:
-            if resp.status == 200: return url, Image.open(BytesIO(await resp.read())).convert("RGB")
-    except: pass
-    return url, None
+async def download_image_async(session: aiohttp.ClientSession, item: dict) -> tuple[str, Image.Image | None]:  # Read-through shared image cache
+    data = await get_image_cache().fetch(session, item["content_hash"], item["image_url"], timeout=8)
+    if data is None: return item["image_url"], None
+    try: return item["image_url"], Image.open(BytesIO(data)).convert("RGB")
+    except Exception: return item["image_url"], None
 
-async def download_batch_async(urls: list[str]) -> dict[str, Image.Image | None]:
+async def download_batch_async(items: list[dict]) -> dict[str, Image.Image | None]:  # items: {content_hash, image_url}
     connector = aiohttp.TCPConnector(limit=DOWNLOAD_CONCURRENCY)
     async with aiohttp.ClientSession(connector=connector, headers={"User-Agent": "Mozilla/5.0"}) as session:
-        return {url: img for url, img in await asyncio.gather(*[download_image_async(session, url) for url in urls])}
+        return {url: img for url, img in await asyncio.gather(*[download_image_async(session, item) for item in items])}
 
 def fetch_all_images_from_db(limit: int = None) -> list[dict]:
-    from vector_db.supabase_client import get_client
+    from vector_db.table_stream import fetch_rows
     print("📂 Fetching images from Supabase...")
-    all_data, offset = [], 0
-    while True:
-        result = get_client().table("image_embeddings").select("content_hash,image_url").range(offset, offset + 999).execute()
-        if not result.data: break
-        all_data.extend(result.data)
-        if len(result.data) < 1000 or (limit and len(all_data) >= limit): break
-        offset += 1000
-    print(f"   Fetched {len(all_data)} images")
-    return all_data[:limit] if limit else all_data
+    images = fetch_rows(["content_hash", "image_url"], limit=limit)  # Keyset pages fetched concurrently; stops at limit
+    print(f"   Fetched {len(images)} images")
+    return images
 
-def run_laion_scoring(limit: int = None, resume: bool = True):
-    images = fetch_all_images_from_db(limit)
-    scored = {}
-    if resume and SCORES_JSON.exists():
-        with open(SCORES_JSON) as f: scored = {r["content_hash"]: r for r in json.load(f)}
-        print(f"   Resuming: {len(scored)} already scored")
-    
-    to_score = [img for img in images if img["content_hash"] not in scored]
-    print(f"📊 Scoring {len(to_score)} images (batch={BATCH_SIZE}, 🚀 LAION ~50x faster)")
-    if not to_score: return print("✅ All done!")
-    
-    scorer = LAIONAestheticScorer()
-    total_batches = (len(to_score) + BATCH_SIZE - 1) // BATCH_SIZE
-    
-    for batch_idx in tqdm(range(0, len(to_score), BATCH_SIZE), total=total_batches, desc="LAION Batches"):
-        batch = to_score[batch_idx:batch_idx + BATCH_SIZE]
-        url_to_img = asyncio.run(download_batch_async([img["image_url"] for img in batch]))
+def _score_items(scorer: "LAIONAestheticScorer", items: list[dict], scored: dict, desc: str = "LAION Batches"):  # Download + openai ViT-L-14 + MLP, written into scored
+    for batch_idx in tqdm(range(0, len(items), BATCH_SIZE), total=(len(items) + BATCH_SIZE - 1) // BATCH_SIZE, desc=desc):
+        batch = items[batch_idx:batch_idx + BATCH_SIZE]
+        url_to_img = asyncio.run(download_batch_async(batch))
         
         valid_items, valid_imgs = [], []
         for item in batch:
@@ -102,6 +86,92 @@ def run_laion_scoring(limit: int = None, resume: bool = True):
         
         if (batch_idx // BATCH_SIZE + 1) % CHECKPOINT_EVERY == 0:
             with open(SCORES_JSON, "w") as f: json.dump(list(scored.values()), f)
+
+def _load_scores() -> dict[str, dict]:
+    if not SCORES_JSON.exists(): return {}
+    with open(SCORES_JSON) as f: return {r["content_hash"]: r for r in json.load(f)}
+
+def _image_urls() -> dict[str, str]:  # content_hash → image_url from the local embedding snapshot (no Supabase round-trip)
+    from vector_db.local_store import LocalEmbeddingStore
+    store = LocalEmbeddingStore()
+    if not store.exists(): return {}
+    cols = store.meta()["columns"]
+    return dict(zip(cols["content_hash"], cols["image_url"]))
+
+def _ridge(X: np.ndarray, y: np.ndarray, lam: float) -> tuple[np.ndarray, float]:  # Closed-form ridge on centered data → (w, b)
+    mu, y_mu = X.mean(axis=0), y.mean()
+    Xc = X - mu
+    w = np.linalg.solve(Xc.T @ Xc + lam * np.eye(X.shape[1]), Xc.T @ (y - y_mu))
+    return w, float(y_mu - mu @ w)
+
+def _rank_corr(a: np.ndarray, b: np.ndarray) -> float:  # Spearman (no ties correction)
+    return float(np.corrcoef(np.argsort(np.argsort(a)), np.argsort(np.argsort(b)))[0, 1])
+
+def calibrate_head(n: int = 2000, seed: int = 0) -> dict:
+    """Fit a linear head on stored laion2b image embeddings against openai-path LAION scores. The LAION MLP has no
+    nonlinearities, so a linear map is the right model class. Reuses existing scores, tops up a random sample to n."""
+    from embedding.component_store import ComponentStore
+    hashes, embs = ComponentStore().load("image")
+    if not hashes: raise FileNotFoundError("No stored image embeddings yet (run embedding.embed_pipeline)")
+    scored = _load_scores()
+    have = [i for i, h in enumerate(hashes) if scored.get(h, {}).get("status") == "success"]
+    urls = None
+    if len(have) < n:
+        rng = np.random.default_rng(seed)
+        urls = _image_urls()
+        missing = [i for i in rng.permutation(len(hashes)) if hashes[i] not in scored and hashes[i] in urls][:n - len(have)]
+        if missing:
+            _score_items(LAIONAestheticScorer(), [{"content_hash": hashes[i], "image_url": urls[hashes[i]]} for i in missing], scored, desc="Calibration")
+            with open(SCORES_JSON, "w") as f: json.dump(list(scored.values()), f)
+            have = [i for i, h in enumerate(hashes) if scored.get(h, {}).get("status") == "success"]
+    if len(have) < MIN_CALIBRATION:
+        reason = ("no image URLs for the stored embeddings (local embedding store missing or empty: run python -m vector_db.local_store)" if urls is not None and not urls
+                  else f"only {len(have)} stored embeddings have an openai-path LAION score (raise N, or check image downloads)")
+        raise ValueError(f"Need at least {MIN_CALIBRATION} labelled images to calibrate the head: {reason}")
+    X = np.asarray(embs[have], dtype=np.float64)
+    y = np.array([scored[hashes[i]]["laion_aesthetic"] for i in have], dtype=np.float64)
+    split = np.random.default_rng(seed).permutation(len(y))
+    tr, te = split[: int(len(y) * 0.8)], split[int(len(y) * 0.8):]
+    results = []
+    for lam in RIDGE_LAMBDAS:
+        w, b = _ridge(X[tr], y[tr], lam)
+        pred = X[te] @ w + b
+        results.append({"lambda": lam, "rmse": float(np.sqrt(np.mean((pred - y[te]) ** 2))), "pearson": float(np.corrcoef(pred, y[te])[0, 1]), "spearman": _rank_corr(pred, y[te])})
+    best = min(results, key=lambda r: r["rmse"])
+    w, b = _ridge(X, y, best["lambda"])  # Refit on all labelled rows
+    HEAD_PATH.parent.mkdir(parents=True, exist_ok=True)
+    np.savez(HEAD_PATH, w=w.astype(np.float32), b=np.float32(b), n=len(y), **{k: v for k, v in best.items()})
+    print(f"✅ Head calibrated on {len(y)} images (λ={best['lambda']}): holdout RMSE {best['rmse']:.3f}, Pearson {best['pearson']:.3f}, Spearman {best['spearman']:.3f}")
+    return best
+
+def run_embedding_scoring() -> int:
+    """Score every stored image embedding with the calibrated head: one (N, 768) @ (768,) matmul, no downloads or CLIP."""
+    from embedding.component_store import ComponentStore
+    if not HEAD_PATH.exists(): raise FileNotFoundError(f"No calibrated head at {HEAD_PATH} (run with --calibrate first)")
+    head = np.load(HEAD_PATH)
+    hashes, embs = ComponentStore().load("image")
+    scores = np.round((embs @ head["w"] + head["b"]).astype(np.float64), 3)
+    scored, urls = _load_scores(), _image_urls()
+    for h, s in zip(hashes, scores.tolist()):
+        if scored.get(h, {}).get("status") == "success": continue  # Keep exact openai-path scores
+        scored[h] = {"content_hash": h, "image_url": urls.get(h), "laion_aesthetic": s, "status": "embedding"}
+    with open(SCORES_JSON, "w") as f: json.dump(list(scored.values()), f)
+    passed = sum(1 for r in scored.values() if r.get("laion_aesthetic") and r["laion_aesthetic"] >= 5.0)
+    print(f"✅ Done! {len(hashes)} scored from stored embeddings (holdout Pearson {float(head['pearson']):.3f}), {passed} passed (>= 5.0)")
+    return len(hashes)
+
+def run_laion_scoring(limit: int = None, resume: bool = True):
+    images = fetch_all_images_from_db(limit)
+    scored = {}
+    if resume and SCORES_JSON.exists():
+        with open(SCORES_JSON) as f: scored = {r["content_hash"]: r for r in json.load(f)}
+        print(f"   Resuming: {len(scored)} already scored")
+    
+    to_score = [img for img in images if img["content_hash"] not in scored]
+    print(f"📊 Scoring {len(to_score)} images (batch={BATCH_SIZE}, 🚀 LAION ~50x faster)")
+    if not to_score: return print("✅ All done!")
+    
+    _score_items(LAIONAestheticScorer(), to_score, scored)
     
     with open(SCORES_JSON, "w") as f: json.dump(list(scored.values()), f)
     passed = sum(1 for r in scored.values() if r.get("laion_aesthetic") and r["laion_aesthetic"] >= 5.0)
@@ -112,6 +182,10 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("--limit", type=int)
     parser.add_argument("--no-resume", action="store_true")
+    parser.add_argument("--from-embeddings", action="store_true", help="Score stored laion2b image embeddings with the calibrated head (no downloads)")
+    parser.add_argument("--calibrate", type=int, metavar="N", help="Fit the laion2b head on N openai-path scores (reuses existing ones)")
     args = parser.parse_args()
-    run_laion_scoring(limit=args.limit, resume=not args.no_resume)
+    if args.calibrate: calibrate_head(args.calibrate)
+    if args.from_embeddings: run_embedding_scoring()
+    elif not args.calibrate: run_laion_scoring(limit=args.limit, resume=not args.no_resume)
 
@@ -7,8 +7,9 @@ from tqdm import tqdm
 from pathlib import Path
 import warnings; warnings.filterwarnings("ignore")
 sys.path.insert(0, str(Path(__file__).parent.parent))
+from embedding.image_cache import get_image_cache
 from vlm.config_vlm import QALIGN_MODEL, QALIGN_DEVICE, QALIGN_SCORES_JSON, QALIGN_MIN_SCORE
-from vector_db.supabase_client import get_client
+from vector_db.table_stream import fetch_rows
 
 MAX_BATCH = 32  # Start aggressive
 MIN_BATCH = 4   # Minimum safe batch
@@ -32,17 +33,16 @@ def load_qalign():
         print("✅ Q-Align loaded")
     return _model
 
-async def download_image_async(session: aiohttp.ClientSession, url: str) -> tuple[str, Image.Image | None]:
-    try:
-        async with session.get(url, timeout=aiohttp.ClientTimeout(total=10)) as resp:
-            if resp.status == 200: return url, Image.open(BytesIO(await resp.read())).convert("RGB")
-    except: pass
-    return url, None
+async def download_image_async(session: aiohttp.ClientSession, item: dict) -> tuple[str, Image.Image | None]:  # Read-through shared image cache
+    data = await get_image_cache().fetch(session, item["content_hash"], item["image_url"], timeout=10)
+    if data is None: return item["image_url"], None
+    try: return item["image_url"], Image.open(BytesIO(data)).convert("RGB")
+    except Exception: return item["image_url"], None
 
-async def download_batch_async(urls: list[str]) -> dict[str, Image.Image | None]:
+async def download_batch_async(items: list[dict]) -> dict[str, Image.Image | None]:  # items: {content_hash, image_url}
     connector = aiohttp.TCPConnector(limit=DOWNLOAD_CONCURRENCY)
     async with aiohttp.ClientSession(connector=connector, headers={"User-Agent": "Mozilla/5.0"}) as session:
-        return {url: img for url, img in await asyncio.gather(*[download_image_async(session, url) for url in urls])}
+        return {url: img for url, img in await asyncio.gather(*[download_image_async(session, item) for item in items])}
 
 def score_batch(model, images: list[Image.Image]) -> tuple[list[float], list[float]]:
     if not images: return [], []
@@ -64,15 +64,9 @@ def score_batch(model, images: list[Image.Image]) -> tuple[list[float], list[flo
 
 def fetch_images(limit: int = None) -> list[dict]:
     print("📂 Fetching images from Supabase...")
-    all_data, offset = [], 0
-    while True:
-        result = get_client().table("image_embeddings").select("content_hash,image_url").range(offset, offset + 999).execute()
-        if not result.data: break
-        all_data.extend(result.data)
-        if len(result.data) < 1000 or (limit and len(all_data) >= limit): break
-        offset += 1000
-    print(f"   Fetched {len(all_data)} images")
-    return all_data[:limit] if limit else all_data
+    images = fetch_rows(["content_hash", "image_url"], limit=limit)  # Keyset pages fetched concurrently; stops at limit
+    print(f"   Fetched {len(images)} images")
+    return images
 
 def run_smart_scoring(limit: int = None, resume: bool = True):
     images = fetch_images(limit)
@@ -106,7 +100,7 @@ def run_smart_scoring(limit: int = None, resume: bool = True):
             consecutive_success = 0
         
         batch = to_score[idx:idx + batch_size]
-        url_to_img = asyncio.run(download_batch_async([img["image_url"] for img in batch]))
+        url_to_img = asyncio.run(download_batch_async(batch))
         
         valid_items, valid_imgs = [], []
         for item in batch: